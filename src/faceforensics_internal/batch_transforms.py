@@ -0,0 +1,124 @@
+"""Transforms that keep samples as uint8 and normalize whole batches at once.
+
+Workers return uint8 tensors (a quarter of the bytes of float32) and the conversion to
+normalized float32 runs once per batch, e.g. in the main process after moving the batch
+to the gpu:
+
+    dataset = file_list.get_dataset("train", uint8_output=True)
+    loader = DataLoader(dataset, batch_size=64, collate_fn=uint8_collate)
+    normalize = BatchNormalize()
+    for samples, targets in loader:
+        samples = normalize(samples.cuda(non_blocking=True))
+
+The result is the same as with transforms.ToTensor() and transforms.Normalize(...) per
+sample.
+"""
+from typing import List
+from typing import Sequence
+
+import numpy as np
+import torch
+from PIL import Image
+from torch.utils.data.dataloader import default_collate
+
+IMAGENET_MEAN = [0.485, 0.456, 0.406]
+IMAGENET_STD = [0.229, 0.224, 0.225]
+
+
+class ToUint8Tensor:
+    """Converts a PIL Image or numpy.ndarray (H x W x C) to a uint8 tensor (C x H x W).
+
+    The tensor is a view of the (H x W x C) memory, i.e. channels last. Tensors are
+    returned as they are."""
+
+    def __call__(self, pic) -> torch.Tensor:
+        if isinstance(pic, torch.Tensor):
+            return pic
+        array = np.array(pic, dtype=np.uint8, copy=True)
+        if array.ndim == 2:
+            array = array[:, :, None]
+        return torch.from_numpy(array).permute(2, 0, 1)
+
+    def __repr__(self):
+        return self.__class__.__name__ + "()"
+
+
+class ArrayToPILImage:
+    """Converts a numpy.ndarray (H x W x C) to a PIL Image. PIL Images are returned as
+    they are, so PIL transforms can be applied to frames that are read as arrays (e.g.
+    preloaded or packed ones) without converting all other frames."""
+
+    def __call__(self, pic):
+        if isinstance(pic, np.ndarray):
+            return Image.fromarray(pic)
+        return pic
+
+    def __repr__(self):
+        return self.__class__.__name__ + "()"
+
+
+class ToFloatTensor:
+    """Converts a uint8 tensor to a float32 tensor in [0, 1], like ToTensor does for PIL
+    images."""
+
+    def __call__(self, tensor: torch.Tensor) -> torch.Tensor:
+        return tensor.float().div_(255)
+
+    def __repr__(self):
+        return self.__class__.__name__ + "()"
+
+
+def _to_channels_last(samples: List[torch.Tensor]) -> torch.Tensor:
+    """Stacks samples of shape (..., C, H, W) to (B, ..., C, H, W) with channels in the
+    innermost dimension of memory."""
+    c = samples[0].dim() - 3
+    to_hwc = list(range(c)) + [c + 1, c + 2, c]
+    stacked = torch.stack([sample.permute(*to_hwc) for sample in samples], dim=0)
+    # stacked is (B, ..., H, W, C)
+    to_chw = list(range(c + 1)) + [c + 3, c + 1, c + 2]
+    return stacked.permute(*to_chw)
+
+
+def uint8_collate(batch: Sequence) -> list:
+    """Collates (sample, target) tuples with uint8 samples.
+
+    The samples are stacked so that the channels are stored last, which is
+    torch.channels_last for (B, C, H, W) batches."""
+    samples, targets = zip(*batch)
+    return [_to_channels_last(list(samples)), default_collate(targets)]
+
+
+class BatchNormalize:
+    """ToTensor and Normalize for a whole uint8 batch of shape (..., C, H, W).
+
+    Statistics of the dataset can be used with
+    BatchNormalize(*dataset_statistics.load_mean_std(path)).
+
+    Args:
+        mean: mean of each channel
+        std: standard deviation of each channel
+        channels_last: convert (B, C, H, W) batches to torch.channels_last. Ignored
+            with torch<1.5, which has no memory formats.
+
+    """
+
+    def __init__(
+        self,
+        mean: Sequence[float] = IMAGENET_MEAN,
+        std: Sequence[float] = IMAGENET_STD,
+        channels_last: bool = True,
+    ):
+        self.mean = mean
+        self.std = std
+        self.channels_last = channels_last
+
+    def __call__(self, batch: torch.Tensor) -> torch.Tensor:
+        if self.channels_last and batch.dim() == 4 and hasattr(torch, "channels_last"):
+            batch = batch.contiguous(memory_format=torch.channels_last)
+        batch = batch.to(dtype=torch.float32).div(255)
+        mean = torch.as_tensor(self.mean, dtype=batch.dtype, device=batch.device)
+        std = torch.as_tensor(self.std, dtype=batch.dtype, device=batch.device)
+        return batch.sub_(mean[:, None, None]).div_(std[:, None, None])
+
+    def __repr__(self):
+        return self.__class__.__name__ + f"(mean={self.mean}, std={self.std})"
@@ -0,0 +1,250 @@
+"""Cached listing of the videos and frames of a FaceForensics root."""
+import json
+import logging
+import os
+import stat
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import Optional
+from typing import Tuple
+from typing import Union
+
+import numpy as np
+
+logger = logging.getLogger(__file__)
+
+CATALOG_FILE = ".catalog.npz"
+DEFAULT_SCAN_WORKERS = 16
+
+
+def _scan_video(path: str) -> dict:
+    """Returns the frame numbers and sizes of the png frames in path."""
+    frames, sizes = [], []
+    with os.scandir(path) as entries:
+        for entry in entries:
+            name, ext = os.path.splitext(entry.name)
+            if ext == ".png" and name.isdigit():
+                frames.append(int(name))
+                sizes.append(entry.stat().st_size)
+    order = np.argsort(frames, kind="stable")
+    return {
+        "frames": np.asarray(frames, dtype=np.int64)[order],
+        "sizes": np.asarray(sizes, dtype=np.int64)[order],
+    }
+
+
+def _list_subdir(subdir: str, cached: Optional[dict]) -> Tuple[int, List[str]]:
+    """Returns the modification time and sorted entry names of subdir. The names are
+    taken from cached if its modification time is still the same."""
+    subdir_mtime = os.stat(subdir).st_mtime_ns
+    if cached is not None and cached["mtime"] == subdir_mtime:
+        return subdir_mtime, list(cached["entries"])
+    with os.scandir(subdir) as entries:
+        return subdir_mtime, sorted(entry.name for entry in entries)
+
+
+def _scan_entry(path: str, cached: Optional[dict]) -> Optional[dict]:
+    """Returns the entry of path, scanning its frames only if cached is outdated."""
+    try:
+        path_stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    is_dir = stat.S_ISDIR(path_stat.st_mode)
+    if (
+        cached is not None
+        and cached["mtime"] == path_stat.st_mtime_ns
+        and cached["is_dir"] == is_dir
+    ):
+        return cached
+    entry = {"is_dir": is_dir, "mtime": path_stat.st_mtime_ns, "size": 0}
+    if is_dir:
+        entry.update(_scan_video(path))
+    else:
+        entry["size"] = path_stat.st_size
+    return entry
+
+
+class Catalog:
+    """Listing of the entries of subdirectories of root (as returned by
+    FaceForensicsDataStructure.get_subdirs) and of the frames of their videos.
+
+    Every subdirectory is scanned with os.scandir on its first use. For each entry the
+    catalog records its modification time and size, for directories (i.e. videos of
+    frames) additionally the frame numbers and file sizes of their png frames. The
+    listing is saved to index_file and reused later: a subdirectory is only listed
+    again if its modification time changed (i.e. videos were added or removed) and a
+    video only if its own modification time changed (i.e. frames were added or
+    removed). So checking a cached subdirectory costs one stat per video instead of a
+    listing of all frames.
+
+    The subdirectories and videos are scanned by a pool of max_workers threads, as
+    most of the time of a scan is spent waiting for the file system. Use prefetch to
+    scan several subdirectories at once.
+
+    Args:
+        root: root of the dataset
+        index_file: file the listing is saved to. Defaults to root/.catalog.npz.
+        max_workers: maximal number of directories scanned concurrently
+
+    """
+
+    def __init__(
+        self,
+        root: Union[str, Path],
+        index_file: Union[str, Path] = None,
+        max_workers: int = DEFAULT_SCAN_WORKERS,
+    ):
+        self.root = Path(root)
+        self.index_file = Path(index_file or self.root / CATALOG_FILE)
+        self.max_workers = max_workers
+        self._subdirs = self._load_index()
+        self._checked = set()
+        self._changed = False
+
+    def _load_index(self) -> Dict[str, dict]:
+        try:
+            with np.load(self.index_file) as index:
+                header = json.loads(index["header"].tobytes().decode())
+                frames, sizes = index["frames"], index["sizes"]
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError, KeyError):
+            logger.warning(f"Could not read {self.index_file}, scanning again.")
+            return {}
+
+        subdirs = {}
+        for subdir, (mtime, entries) in header.items():
+            subdirs[subdir] = {"mtime": mtime, "entries": {}}
+            for name, (is_dir, entry_mtime, size, offset, count) in entries.items():
+                entry = {"is_dir": is_dir, "mtime": entry_mtime, "size": size}
+                if is_dir:
+                    entry["frames"] = frames[offset : offset + count]  # noqa E203
+                    entry["sizes"] = sizes[offset : offset + count]  # noqa E203
+                subdirs[subdir]["entries"][name] = entry
+        return subdirs
+
+    def save(self):
+        """Saves the listing to index_file, if anything changed since loading it."""
+        if not self._changed:
+            return
+        header, frames, sizes = {}, [], []
+        offset = 0
+        for subdir, listing in self._subdirs.items():
+            entries = {}
+            for name, entry in listing["entries"].items():
+                count = len(entry["frames"]) if entry["is_dir"] else 0
+                entries[name] = [
+                    entry["is_dir"],
+                    entry["mtime"],
+                    entry["size"],
+                    offset,
+                    count,
+                ]
+                if entry["is_dir"]:
+                    frames.append(entry["frames"])
+                    sizes.append(entry["sizes"])
+                offset += count
+            header[subdir] = [listing["mtime"], entries]
+
+        tmp_file = self.index_file.with_name(f"{self.index_file.name}.{os.getpid()}")
+        try:
+            with open(tmp_file, "wb") as f:
+                np.savez(
+                    f,
+                    header=np.frombuffer(json.dumps(header).encode(), dtype=np.uint8),
+                    frames=np.concatenate([np.array([], np.int64)] + frames),
+                    sizes=np.concatenate([np.array([], np.int64)] + sizes),
+                )
+            os.replace(tmp_file, self.index_file)
+            self._changed = False
+        except OSError as e:
+            logger.warning(f"Could not save catalog to {self.index_file}: {e}")
+
+    def _key(self, subdir: Union[str, Path]) -> str:
+        subdir = Path(subdir)
+        try:
+            return subdir.relative_to(self.root).as_posix()
+        except ValueError:
+            return subdir.as_posix()
+
+    def prefetch(self, subdirs: Iterable[Union[str, Path]]):
+        """Scans all subdirs (and their videos) concurrently. Subdirs that don't exist
+        are skipped, videos() raises FileNotFoundError for them."""
+        keys = []
+        for subdir in subdirs:
+            key = self._key(subdir)
+            if key in self._checked or key in keys:
+                continue
+            if not os.path.isdir(self.root / key):
+                logger.info(f"Skipping {self.root / key}, it does not exist.")
+                continue
+            keys.append(key)
+        if not keys:
+            return
+
+        cached = [self._subdirs.get(key) for key in keys]
+        with ThreadPoolExecutor(max_workers=max(self.max_workers, 1)) as executor:
+            listed = list(
+                executor.map(
+                    _list_subdir, [str(self.root / key) for key in keys], cached
+                )
+            )
+            paths, cached_entries = [], []
+            for key, cached_listing, (_, names) in zip(keys, cached, listed):
+                old_entries = cached_listing["entries"] if cached_listing else {}
+                for name in names:
+                    paths.append(os.path.join(self.root, key, name))
+                    cached_entries.append(old_entries.get(name))
+            entries = iter(executor.map(_scan_entry, paths, cached_entries))
+
+        for key, cached_listing, (subdir_mtime, names) in zip(keys, cached, listed):
+            listing = {"mtime": subdir_mtime, "entries": {}}
+            for name in names:
+                entry = next(entries)
+                if entry is not None:
+                    listing["entries"][name] = entry
+            if cached_listing is None or not _same_listing(cached_listing, listing):
+                self._changed = True
+            self._subdirs[key] = listing
+            self._checked.add(key)
+
+    def _get_listing(self, subdir: Union[str, Path]) -> dict:
+        key = self._key(subdir)
+        if key not in self._checked:
+            self.prefetch([key])
+        if key not in self._checked:
+            raise FileNotFoundError(f"{self.root / key} does not exist.")
+        return self._subdirs[key]
+
+    def videos(self, subdir: Union[str, Path]) -> List[Path]:
+        """Returns the sorted paths of all entries of subdir, like sorted(iterdir())."""
+        listing = self._get_listing(subdir)
+        return [self.root / self._key(subdir) / name for name in listing["entries"]]
+
+    def frames(self, video: Union[str, Path]) -> np.ndarray:
+        """Returns the sorted frame numbers of the png frames of video. Empty if video
+        is a file."""
+        return self._video_entry(video).get("frames", np.array([], dtype=np.int64))
+
+    def frame_sizes(self, video: Union[str, Path]) -> np.ndarray:
+        """Returns the file sizes of the frames returned by frames()."""
+        return self._video_entry(video).get("sizes", np.array([], dtype=np.int64))
+
+    def _video_entry(self, video: Union[str, Path]) -> dict:
+        video = Path(video)
+        entry = self._get_listing(video.parent)["entries"].get(video.name)
+        if entry is None:
+            raise FileNotFoundError(f"{video} does not exist.")
+        return entry
+
+
+def _same_listing(a: dict, b: dict) -> bool:
+    if a["mtime"] != b["mtime"] or a["entries"].keys() != b["entries"].keys():
+        return False
+    return all(
+        entry["mtime"] == b["entries"][name]["mtime"]
+        for name, entry in a["entries"].items()
+    )
@@ -0,0 +1,178 @@
+"""Per-channel statistics of the frames of a FileList split.
+
+The frames are decoded by a pool of processes, every process accumulates the
+statistics of its chunk of frames and the partial results are merged with the
+parallel algorithm of Chan et al., so mean and variance are computed in a single,
+numerically stable pass. Values are scaled to [0, 1] like by transforms.ToTensor, so
+the result can be used by transforms.Normalize or BatchNormalize:
+
+    compute_statistics(file_list, "train").save("statistics.json")
+    dataset = file_list.get_dataset("train", statistics="statistics.json")
+"""
+import json
+import logging
+import time
+from concurrent.futures import as_completed
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import List
+from typing import Tuple
+from typing import Union
+
+import numpy as np
+from tqdm import tqdm
+
+from faceforensics_internal.decoders import get_decoder
+from faceforensics_internal.decoders import PIL_DECODER
+from faceforensics_internal.decoders import to_rgb_array
+
+logger = logging.getLogger(__file__)
+
+
+class ChannelStatistics:
+    """Mean, variance and optionally histograms of the channels of images.
+
+    Args:
+        num_channels: number of channels of the images
+        histograms: count the uint8 values of each channel as well
+
+    """
+
+    def __init__(self, num_channels: int = 3, histograms: bool = False):
+        self.count = 0
+        self.mean = np.zeros(num_channels, dtype=np.float64)
+        self.m2 = np.zeros(num_channels, dtype=np.float64)
+        self.histograms = (
+            np.zeros((num_channels, 256), dtype=np.int64) if histograms else None
+        )
+
+    def update(self, image: np.ndarray):
+        """Adds the pixels of a (H x W x C) uint8 image."""
+        pixels = image.reshape(-1, image.shape[-1])
+        other = ChannelStatistics(pixels.shape[1])
+        other.count = len(pixels)
+        values = pixels.astype(np.float64) / 255
+        other.mean = values.mean(axis=0)
+        other.m2 = ((values - other.mean) ** 2).sum(axis=0)
+        if self.histograms is not None:
+            other.histograms = np.stack(
+                [np.bincount(channel, minlength=256) for channel in pixels.T]
+            )
+        self.merge(other)
+
+    def merge(self, other: "ChannelStatistics"):
+        """Adds the statistics of other (Chan et al.)."""
+        if other.count == 0:
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean = self.mean + delta * other.count / count
+        self.m2 = self.m2 + other.m2 + delta ** 2 * self.count * other.count / count
+        self.count = count
+        if self.histograms is not None and other.histograms is not None:
+            self.histograms += other.histograms
+
+    @property
+    def variance(self) -> np.ndarray:
+        return self.m2 / max(self.count, 1)
+
+    @property
+    def std(self) -> np.ndarray:
+        return np.sqrt(self.variance)
+
+    def to_dict(self) -> dict:
+        statistics = {
+            "count": self.count,
+            "mean": self.mean.tolist(),
+            "std": self.std.tolist(),
+            "m2": self.m2.tolist(),
+        }
+        if self.histograms is not None:
+            statistics["histograms"] = self.histograms.tolist()
+        return statistics
+
+    def save(self, path: Union[str, Path]):
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f)
+
+    @classmethod
+    def load(cls, path: Union[str, Path]) -> "ChannelStatistics":
+        with open(path, "r") as f:
+            statistics = json.load(f)
+        channel_statistics = cls(
+            len(statistics["mean"]), histograms="histograms" in statistics
+        )
+        channel_statistics.count = statistics["count"]
+        channel_statistics.mean = np.array(statistics["mean"])
+        channel_statistics.m2 = np.array(statistics["m2"])
+        if "histograms" in statistics:
+            channel_statistics.histograms = np.array(statistics["histograms"])
+        return channel_statistics
+
+
+def load_mean_std(path: Union[str, Path]) -> Tuple[List[float], List[float]]:
+    """Returns mean and std saved by ChannelStatistics.save."""
+    statistics = ChannelStatistics.load(path)
+    return statistics.mean.tolist(), statistics.std.tolist()
+
+
+def _chunk_statistics(paths: List[str], histograms: bool, decoder: str):
+    loader = get_decoder(decoder)
+    statistics = ChannelStatistics(histograms=histograms)
+    for path in paths:
+        statistics.update(to_rgb_array(loader(path)))
+    return statistics
+
+
+def compute_statistics(
+    file_list,
+    split: str,
+    num_workers: int = 8,
+    chunk_size: int = 256,
+    max_frames: int = None,
+    histograms: bool = False,
+    decoder: str = PIL_DECODER,
+    seed: int = 0,
+) -> ChannelStatistics:
+    """Computes the statistics of the sampled frames of split of file_list.
+
+    Args:
+        file_list: file list the frames are taken from
+        split: split the frames are taken from
+        num_workers: number of processes decoding the frames
+        chunk_size: number of frames per task of the processes
+        max_frames: only use a random subset of this many frames
+        histograms: compute the histograms of the channels as well
+        decoder: image decoder, see faceforensics_internal.decoders
+        seed: seed for choosing the subset of frames
+
+    """
+    frames = np.asarray(file_list.samples_idx[split])
+    if max_frames is not None and max_frames < len(frames):
+        rng = np.random.RandomState(seed)
+        frames = np.sort(rng.choice(frames, max_frames, replace=False))
+    samples = file_list.samples[split]
+    paths = [f"{file_list.root}/{samples.path(int(frame))}" for frame in frames]
+
+    start_time = time.time()
+    statistics = ChannelStatistics(histograms=histograms)
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        futures = [
+            executor.submit(
+                _chunk_statistics,
+                paths[start : start + chunk_size],  # noqa E203
+                histograms,
+                decoder,
+            )
+            for start in range(0, len(paths), chunk_size)
+        ]
+        for future in tqdm(as_completed(futures), total=len(futures)):
+            statistics.merge(future.result())
+    duration = time.time() - start_time
+
+    logger.info(
+        f"Computed statistics of {len(paths)} frames in {duration:.1f}s "
+        f"({len(paths) / duration:.0f} frames/s, "
+        f"{statistics.count / duration / 1e6:.1f} Mpixels/s)."
+    )
+    return statistics
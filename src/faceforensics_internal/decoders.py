@@ -0,0 +1,64 @@
+"""Image decoders that can be used as loader of a FileListDataset.
+
+- pil: torchvision's default_loader, returns a RGB PIL image
+- cv2: cv2.imdecode into a (H x W x 3) uint8 array, RGB as reversed view of the BGR
+  array, so no copy is made
+- torchvision: torchvision.io.decode_png, returns a (3 x H x W) uint8 tensor. Needs
+  torchvision>=0.9, torchvision.io is only imported when it's used
+
+Only pil returns PIL images, so transforms for the other decoders have to work on
+tensors (see FileList.get_dataset).
+"""
+from typing import Callable
+
+import cv2
+import numpy as np
+import torch
+from torchvision.datasets.folder import default_loader
+
+PIL_DECODER = "pil"
+CV2_DECODER = "cv2"
+TORCHVISION_DECODER = "torchvision"
+
+
+def cv2_loader(path: str) -> np.ndarray:
+    bgr = cv2.imdecode(np.fromfile(path, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if bgr is None:
+        raise ValueError(f"Could not decode {path}.")
+    return bgr[:, :, ::-1]
+
+
+def torchvision_loader(path: str) -> torch.Tensor:
+    try:
+        from torchvision.io import decode_png
+        from torchvision.io import ImageReadMode
+        from torchvision.io import read_file
+    except ImportError:
+        raise ImportError(
+            f"The {TORCHVISION_DECODER} decoder needs torchvision>=0.9, use "
+            f"{PIL_DECODER} or {CV2_DECODER} instead."
+        )
+    return decode_png(read_file(path), mode=ImageReadMode.RGB)
+
+
+DECODERS = {
+    PIL_DECODER: default_loader,
+    CV2_DECODER: cv2_loader,
+    TORCHVISION_DECODER: torchvision_loader,
+}
+
+
+def get_decoder(name: str) -> Callable:
+    try:
+        return DECODERS[name]
+    except KeyError:
+        raise ValueError(f"Unknown decoder {name}. Choose one of {list(DECODERS)}.")
+
+
+def to_rgb_array(image) -> np.ndarray:
+    """Converts the output of any decoder to a (H x W x 3) uint8 array."""
+    if isinstance(image, torch.Tensor):
+        return image.permute(1, 2, 0).numpy()
+    if isinstance(image, np.ndarray):
+        return image
+    return np.asarray(image.convert("RGB"), dtype=np.uint8)
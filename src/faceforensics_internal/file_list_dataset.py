@@ -1,35 +1,338 @@
+import copy
+import errno
+import fcntl
 import json
 import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from pprint import pformat
 from shutil import copy2
+from shutil import copystat
+from typing import Dict
 from typing import List
+from typing import Tuple
+from typing import Type
+from typing import Union
 
 import numpy as np
 import torch
+from PIL import Image
 from torch.utils.data import Dataset
+from torch.utils.data.dataloader import default_collate
 from torchvision import transforms
 from torchvision.datasets import VisionDataset
-from torchvision.datasets.folder import default_loader
 from tqdm import tqdm
 
+from faceforensics_internal.batch_transforms import IMAGENET_MEAN
+from faceforensics_internal.batch_transforms import IMAGENET_STD
+from faceforensics_internal.batch_transforms import ArrayToPILImage
+from faceforensics_internal.batch_transforms import ToFloatTensor
+from faceforensics_internal.batch_transforms import ToUint8Tensor
+from faceforensics_internal.dataset_statistics import load_mean_std
+from faceforensics_internal.decoders import get_decoder
+from faceforensics_internal.decoders import PIL_DECODER
+from faceforensics_internal.decoders import TORCHVISION_DECODER
+from faceforensics_internal.decoders import to_rgb_array
+from faceforensics_internal.frame_cache import LRUFrameCache
+from faceforensics_internal.frame_cache import SharedFrameCache
+from faceforensics_internal.local_cache import LocalDiskCache
+from faceforensics_internal.mask_store import MASK_SUFFIX
+from faceforensics_internal.mask_store import MaskFile
 from faceforensics_internal.splits import TEST_NAME
 from faceforensics_internal.splits import TRAIN_NAME
 from faceforensics_internal.splits import VAL_NAME
+from faceforensics_internal.utils import _sub_crop_bbs
+from faceforensics_internal.utils import Compression
+from faceforensics_internal.utils import DataType
 
 logger = logging.getLogger(__file__)
 
 
+FRAME_NAME = "{:04d}.png"
+# written next to the frames by extract_faces_tracked_from_bounding_boxes, read for
+# face_scale and masks
+VIDEO_FILES = ("tracked_bb.json", "relative_bb.json", "crop_scale.json")
+
+BINARY_MAGIC = b"FFLIST01"
+BINARY_SUFFIX = ".ffl"
+BINARY_ALIGNMENT = 64
+
+HARDLINK = "hardlink"
+REFLINK = "reflink"
+LINK_MODES = (HARDLINK, REFLINK)
+_FICLONE = 0x40049409  # ioctl of linux/fs.h that clones a file (copy on write)
+
+
+def _align(offset: int) -> int:
+    return -(-offset // BINARY_ALIGNMENT) * BINARY_ALIGNMENT
+
+
+def _memmap(path, dtype: str, offset: int, length: int) -> np.ndarray:
+    if length == 0:
+        # empty arrays can't be memory-mapped
+        return np.empty(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="c", offset=offset, shape=(length,))
+
+
+def _crop(image, bounding_box: List[int]):
+    """Crops a PIL image, (H x W x C) array or (C x H x W) tensor. Arrays and tensors
+    are cropped as views. The sizes of crops that were clamped at the border of the
+    frame are floats in tracked_bb.json, so the box is cast to int."""
+    x, y, w, h = (int(value) for value in bounding_box)
+    if isinstance(image, Image.Image):
+        return image.crop((x, y, x + w, y + h))
+    if isinstance(image, torch.Tensor):
+        return image[:, y : y + h, x : x + w]  # noqa E203
+    return image[y : y + h, x : x + w]  # noqa E203
+
+
+def _mask_path(directory: str) -> str:
+    """Returns the path of the mask file of the video of directory
+    (<method dir>/<compression>/<data type>/<video>)."""
+    method_dir, _, _, video = directory.rsplit("/", 3)
+    return f"{method_dir}/{Compression.masks}/{DataType.rle_masks}/{video}{MASK_SUFFIX}"
+
+
+def _split_sample_path(path: str) -> Tuple[str, int]:
+    """Splits a sample path into its directory and frame number."""
+    directory, _, name = path.rpartition("/")
+    try:
+        frame = int(name.split(".")[0])
+    except ValueError:
+        frame = None
+    if frame is None or FRAME_NAME.format(frame) != name:
+        raise ValueError(f"{path} is not named like {FRAME_NAME}.")
+    return directory, frame
+
+
+def _encode_runs(
+    dir_ids: np.ndarray, frames: np.ndarray, labels: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Encodes samples given by dir_id, frame number and label as runs of consecutive
+    frames. Returns dir_id, first frame, frame count and label of each run."""
+    if len(frames) == 0:
+        return dir_ids, frames, frames, labels
+    breaks = (np.diff(dir_ids) != 0) | (np.diff(frames) != 1) | (np.diff(labels) != 0)
+    starts = np.concatenate([[0], np.flatnonzero(breaks) + 1])
+    counts = np.diff(np.concatenate([starts, [len(frames)]]))
+    return dir_ids[starts], frames[starts], counts, labels[starts]
+
+
+def _copy_file(source: str, target: str, link: str = None) -> Tuple[str, int]:
+    """Copies source to target, unless target exists with the same size and mtime.
+
+    With link set to HARDLINK or REFLINK, target is hard linked to source or cloned
+    from it instead. If that is not possible (e.g. they are on different file
+    systems) source is copied. Returns what was done and the number of bytes.
+    """
+    source_stat = os.stat(source)
+    try:
+        target_stat = os.stat(target)
+        if target_stat.st_size == source_stat.st_size and int(
+            target_stat.st_mtime
+        ) == int(source_stat.st_mtime):
+            return "skipped", source_stat.st_size
+        os.remove(target)
+    except FileNotFoundError:
+        pass
+
+    if link == HARDLINK:
+        try:
+            os.link(source, target)
+            return "linked", source_stat.st_size
+        except OSError as e:
+            if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+                raise
+    elif link == REFLINK:
+        try:
+            with open(source, "rb") as src, open(target, "wb") as dst:
+                fcntl.ioctl(dst.fileno(), _FICLONE, src.fileno())
+            copystat(source, target)
+            return "linked", source_stat.st_size
+        except OSError as e:
+            if e.errno not in (errno.EXDEV, errno.EOPNOTSUPP, errno.EINVAL):
+                raise
+
+    copy2(source, target)
+    return "copied", source_stat.st_size
+
+
+def _referenced_frames(samples_idx: List[int], sequence_length: int) -> np.ndarray:
+    """Returns sorted indices of all samples covered by a window ending in samples_idx.
+    """
+    samples_idx = np.asarray(samples_idx, dtype=np.int64)
+    if len(samples_idx) == 0:
+        return samples_idx
+    frames = samples_idx[:, None] - np.arange(sequence_length)[None, :]
+    frames = np.unique(frames)
+    return frames[frames >= 0]
+
+
+class SampleRuns:
+    """Samples of one split, stored as runs of consecutive frames of a video.
+
+    Each run is described by the id of its directory in self.directories, its first
+    frame number, its number of frames and its label. Sample i is the (i - offset)-th
+    frame of the run it falls into. Its path and label are only created on access, so
+    indexing and iterating yield (path, label) tuples just like a list would."""
+
+    def __init__(
+        self,
+        directories: List[str],
+        dir_ids=(),
+        first_frames=(),
+        frame_counts=(),
+        labels=(),
+    ):
+        self.directories = directories
+        self.dir_ids = np.asarray(dir_ids, dtype=np.int32)
+        self.first_frames = np.asarray(first_frames, dtype=np.int32)
+        self.frame_counts = np.asarray(frame_counts, dtype=np.int32)
+        self.labels = np.asarray(labels, dtype=np.int32)
+        self._update_offsets()
+
+    def _update_offsets(self):
+        self.offsets = np.concatenate(
+            [[0], np.cumsum(self.frame_counts, dtype=np.int64)]
+        )
+
+    def append(self, dir_ids, frames, labels):
+        """Appends samples given by dir_id, frame number and label."""
+        dir_ids, first_frames, frame_counts, labels = _encode_runs(
+            np.asarray(dir_ids, dtype=np.int32),
+            np.asarray(frames, dtype=np.int32),
+            np.asarray(labels, dtype=np.int32),
+        )
+        # continue the last run if possible
+        if (
+            len(self.dir_ids) > 0
+            and len(dir_ids) > 0
+            and self.dir_ids[-1] == dir_ids[0]
+            and self.labels[-1] == labels[0]
+            and self.first_frames[-1] + self.frame_counts[-1] == first_frames[0]
+        ):
+            self.frame_counts[-1] += frame_counts[0]
+            dir_ids, first_frames = dir_ids[1:], first_frames[1:]
+            frame_counts, labels = frame_counts[1:], labels[1:]
+
+        self.dir_ids = np.concatenate([self.dir_ids, dir_ids])
+        self.first_frames = np.concatenate([self.first_frames, first_frames])
+        self.frame_counts = np.concatenate([self.frame_counts, frame_counts])
+        self.labels = np.concatenate([self.labels, labels])
+        self._update_offsets()
+
+    def _locate(self, index: int) -> Tuple[int, int]:
+        """Returns the run of sample index and the index made non-negative."""
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(f"{index} is out of range {len(self)}")
+        return int(np.searchsorted(self.offsets, index, side="right")) - 1, index
+
+    def run_of(self, index: int) -> int:
+        """Returns the run sample index belongs to."""
+        return self._locate(index)[0]
+
+    def runs_of(self, indices: np.ndarray) -> np.ndarray:
+        """Vectorized run_of for an array of non-negative sample indices."""
+        return np.searchsorted(self.offsets, indices, side="right") - 1
+
+    def frame_number(self, index: int) -> int:
+        run, index = self._locate(index)
+        return int(self.first_frames[run] + index - self.offsets[run])
+
+    def path(self, index: int) -> str:
+        run, index = self._locate(index)
+        frame = self.first_frames[run] + index - self.offsets[run]
+        return f"{self.directories[self.dir_ids[run]]}/{FRAME_NAME.format(frame)}"
+
+    def label(self, index: int) -> int:
+        return int(self.labels[self.run_of(index)])
+
+    @property
+    def targets(self) -> np.ndarray:
+        """Label of every sample."""
+        return np.repeat(self.labels, self.frame_counts)
+
+    def arrays(self) -> dict:
+        return {
+            "dir_ids": self.dir_ids,
+            "first_frames": self.first_frames,
+            "frame_counts": self.frame_counts,
+            "labels": self.labels,
+        }
+
+    def to_dict(self) -> dict:
+        return {name: array.tolist() for name, array in self.arrays().items()}
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        return self.path(index), self.label(index)
+
+    def __iter__(self):
+        for run in range(len(self.dir_ids)):
+            directory = self.directories[self.dir_ids[run]]
+            label = int(self.labels[run])
+            first_frame = self.first_frames[run]
+            for frame in range(first_frame, first_frame + self.frame_counts[run]):
+                yield f"{directory}/{FRAME_NAME.format(frame)}", label
+
+    def __len__(self):
+        return int(self.offsets[-1])
+
+
 class FileList:
-    def __init__(self, root: str, classes: List[str], min_sequence_length: int):
+    """Samples of all splits together with the indices of the samples that were
+    selected for each split.
+
+    The samples are stored as SampleRuns, i.e. as runs of consecutive frames of the
+    directories in self.directories. samples_per_video holds the number of frames that
+    were selected per video of each split (None if unknown, e.g. for older files)."""
+
+    def __init__(
+        self,
+        root: str,
+        classes: List[str],
+        min_sequence_length: int,
+        samples_per_video: Dict[str, int] = None,
+    ):
         self.root = root
         self.classes = classes
         self.class_to_idx = {cls: idx for idx, cls in enumerate(self.classes)}
 
-        self.samples = {TRAIN_NAME: [], VAL_NAME: [], TEST_NAME: []}
-        self.samples_idx = {TRAIN_NAME: [], VAL_NAME: [], TEST_NAME: []}
+        self.directories = []
+        self._directory_to_id = {}
+        self.samples = {
+            split: SampleRuns(self.directories)
+            for split in [TRAIN_NAME, VAL_NAME, TEST_NAME]
+        }
+        self.samples_idx = {
+            split: np.array([], dtype=np.int64)
+            for split in [TRAIN_NAME, VAL_NAME, TEST_NAME]
+        }
 
         self.min_sequence_length = min_sequence_length
+        self.samples_per_video = samples_per_video
+        self._directory_attributes = None
+
+    def _get_dir_id(self, directory: str) -> int:
+        try:
+            return self._directory_to_id[directory]
+        except KeyError:
+            self._directory_to_id[directory] = len(self.directories)
+            self.directories.append(directory)
+            return self._directory_to_id[directory]
+
+    def _add_sample_paths(self, sample_paths: List[str], labels: List[int], split: str):
+        dir_ids, frames = [], []
+        for sample_path in sample_paths:
+            directory, frame = _split_sample_path(sample_path)
+            dir_ids.append(self._get_dir_id(directory))
+            frames.append(frame)
+        self.samples[split].append(dir_ids, frames, labels)
 
     def add_data_point(self, path: Path, target_label: str, split: str):
         """Adds datapoint to samples.
@@ -41,9 +344,7 @@ class FileList:
             split: indicates current split (train, val, test)
 
         """
-        self.samples[split].append(
-            (str(path.relative_to(self.root)), self.class_to_idx[target_label])
-        )
+        self.add_data_points([path], target_label, split, np.array([], dtype=int))
 
     def add_data_points(
         self,
@@ -53,67 +354,485 @@ class FileList:
         sampled_images_idx: np.array,
     ):
         nb_samples_offset = len(self.samples[split])
-        sampled_images_idx = (sampled_images_idx + nb_samples_offset).tolist()
-        self.samples_idx[split] += sampled_images_idx
+        self.samples_idx[split] = np.concatenate(
+            [
+                self.samples_idx[split],
+                np.asarray(sampled_images_idx, dtype=np.int64) + nb_samples_offset,
+            ]
+        )
 
-        for path in path_list:
-            self.add_data_point(path, target_label, split)
+        self._add_sample_paths(
+            [path.relative_to(self.root).as_posix() for path in path_list],
+            [self.class_to_idx[target_label]] * len(path_list),
+            split,
+        )
+
+    def add_videos(
+        self,
+        video_folders: List[Path],
+        frames: List[np.ndarray],
+        target_label: str,
+        split: str,
+        sampled_images_idx: np.array,
+    ):
+        """Adds all frames of several videos to samples, like add_data_points without
+        building and parsing the path of every frame.
+
+        Args:
+            video_folders: have to be subpaths of self.root
+            frames: frame numbers of each video
+            target_label: label of the datapoints
+            split: indicates current split (train, val, test)
+            sampled_images_idx: indices of the sampled frames in the concatenated
+                frames of all videos
+
+        """
+        nb_samples_offset = len(self.samples[split])
+        self.samples_idx[split] = np.concatenate(
+            [
+                self.samples_idx[split],
+                np.asarray(sampled_images_idx, dtype=np.int64) + nb_samples_offset,
+            ]
+        )
+
+        dir_ids = [
+            self._get_dir_id(video_folder.relative_to(self.root).as_posix())
+            for video_folder in video_folders
+        ]
+        nb_frames = [len(video_frames) for video_frames in frames]
+        self.samples[split].append(
+            np.repeat(dir_ids, nb_frames),
+            np.concatenate(frames),
+            np.full(sum(nb_frames), self.class_to_idx[target_label]),
+        )
+
+    def add_class(self, class_name: str):
+        """Adds class_name to the classes, if it isn't one yet. The indices of the
+        existing classes stay the same."""
+        if class_name not in self.class_to_idx:
+            self.classes = list(self.classes) + [class_name]
+            self.class_to_idx[class_name] = (
+                max(self.class_to_idx.values(), default=-1) + 1
+            )
+
+    def get_subdirs(self) -> List[str]:
+        """Returns the subdirectories (<method dir>/<compression>/<data type>) of all
+        directories, in the order they were added."""
+        return list(
+            dict.fromkeys(
+                directory.rpartition("/")[0] for directory in self.directories
+            )
+        )
+
+    def drop_subdirs(self, subdirs: List[str]):
+        """Removes all samples of the directories in subdirs, as returned by
+        get_subdirs. The remaining samples keep their order and classes their indices.
+        """
+        prefixes = tuple(f"{subdir.rstrip('/')}/" for subdir in subdirs)
+        keep_directories = np.array(
+            [not directory.startswith(prefixes) for directory in self.directories],
+            dtype=bool,
+        )
+        if keep_directories.all():
+            return
+        new_dir_ids = np.cumsum(keep_directories) - 1
+
+        for split, samples in self.samples.items():
+            keep_runs = keep_directories[samples.dir_ids]
+            dropped_before = np.concatenate(
+                [[0], np.cumsum(np.where(keep_runs, 0, samples.frame_counts))]
+            )
+            samples_idx = self.samples_idx[split]
+            runs = samples.runs_of(samples_idx)
+            keep_samples = keep_runs[runs]
+            self.samples_idx[split] = (
+                samples_idx[keep_samples] - dropped_before[runs[keep_samples]]
+            )
+            self.samples[split] = SampleRuns(
+                self.directories,
+                new_dir_ids[samples.dir_ids[keep_runs]],
+                samples.first_frames[keep_runs],
+                samples.frame_counts[keep_runs],
+                samples.labels[keep_runs],
+            )
+
+        # SampleRuns share self.directories, so it is changed in place
+        self.directories[:] = [
+            directory
+            for directory, keep in zip(self.directories, keep_directories)
+            if keep
+        ]
+        self._directory_to_id = {
+            directory: dir_id for dir_id, directory in enumerate(self.directories)
+        }
+        self._directory_attributes = None
+
+    def _header(self) -> dict:
+        return {
+            "root": str(self.root),  # carefull with self.root->Path
+            "classes": self.classes,
+            "class_to_idx": self.class_to_idx,
+            "min_sequence_length": self.min_sequence_length,
+            "samples_per_video": self.samples_per_video,
+            "directories": self.directories,
+        }
 
     def save(self, path):
-        """Save self.__dict__ as json."""
+        """Save as json or, if path ends with BINARY_SUFFIX, in the binary format."""
+        if str(path).endswith(BINARY_SUFFIX):
+            self._save_binary(path)
+            return
+
         with open(path, "w") as f:
-            json.dump(self.__dict__, f)  # carefull with self.root->Path
+            json.dump(
+                {
+                    **self._header(),
+                    "samples": {
+                        split: samples.to_dict()
+                        for split, samples in self.samples.items()
+                    },
+                    "samples_idx": {
+                        split: samples_idx.tolist()
+                        for split, samples_idx in self.samples_idx.items()
+                    },
+                },
+                f,
+            )
+
+    def _save_binary(self, path):
+        """Save in the binary format.
+
+        The file starts with BINARY_MAGIC and the length of a json header, followed by
+        the header and an independent section per split. Each section consists of the
+        arrays of the SampleRuns and samples_idx of this split. The header stores
+        offset, dtype and length of every array, so a single split can be
+        memory-mapped without reading the others."""
+        arrays = []
+        sections = {}
+        offset = 0
+        for split, samples in self.samples.items():
+            sections[split] = {}
+            split_arrays = {**samples.arrays(), "samples_idx": self.samples_idx[split]}
+            for name, array in split_arrays.items():
+                array = np.ascontiguousarray(array)
+                sections[split][name] = [offset, array.dtype.str, len(array)]
+                arrays.append((offset, array))
+                offset = _align(offset + array.nbytes)
+
+        header = json.dumps({**self._header(), "sections": sections}).encode()
+        with open(path, "wb") as f:
+            f.write(BINARY_MAGIC)
+            f.write(len(header).to_bytes(8, "little"))
+            f.write(header)
+            data_start = _align(f.tell())
+            for offset, array in arrays:
+                f.seek(data_start + offset)
+                f.write(array.tobytes())
 
     @classmethod
     def load(cls, path):
-        """Restore instance from json via self.__dict__."""
+        """Restore instance from json or the binary format.
+
+        Json files that store the samples as list of (path, label) are converted to
+        runs."""
+        with open(path, "rb") as f:
+            if f.read(len(BINARY_MAGIC)) == BINARY_MAGIC:
+                return cls._load_binary(path)
+
         with open(path, "r") as f:
             __dict__ = json.load(f)
-        file_list = cls.__new__(cls)
-        file_list.__dict__.update(__dict__)
+        file_list = cls._from_header(__dict__)
+
+        for split, samples in __dict__["samples"].items():
+            if isinstance(samples, list):
+                file_list.samples[split] = SampleRuns(file_list.directories)
+                if samples:
+                    sample_paths, labels = zip(*samples)
+                    file_list._add_sample_paths(sample_paths, labels, split)
+            else:
+                file_list.samples[split] = SampleRuns(file_list.directories, **samples)
+            file_list.samples_idx[split] = np.asarray(
+                __dict__["samples_idx"][split], dtype=np.int64
+            )
         return file_list
 
-    def copy_to(self, new_root: Path):
+    @classmethod
+    def _load_binary(cls, path):
+        """Restore instance from the binary format.
+
+        All arrays are memory-mapped (copy-on-write), so only the pages of the splits
+        that are actually used are read from disk."""
+        with open(path, "rb") as f:
+            f.seek(len(BINARY_MAGIC))
+            header_length = int.from_bytes(f.read(8), "little")
+            header = json.loads(f.read(header_length).decode())
+            data_start = _align(f.tell())
+
+        file_list = cls._from_header(header)
+        for split, section in header["sections"].items():
+            arrays = {
+                name: _memmap(path, dtype, data_start + offset, length)
+                for name, (offset, dtype, length) in section.items()
+            }
+            file_list.samples_idx[split] = arrays.pop("samples_idx")
+            file_list.samples[split] = SampleRuns(file_list.directories, **arrays)
+        return file_list
+
+    @classmethod
+    def _from_header(cls, header: dict):
+        file_list = cls(
+            header["root"],
+            header["classes"],
+            header["min_sequence_length"],
+            header.get("samples_per_video"),
+        )
+        file_list.class_to_idx = header["class_to_idx"]
+        for directory in header.get("directories", []):
+            file_list._get_dir_id(directory)
+        return file_list
+
+    def _get_directory_attributes(self) -> Dict[str, np.ndarray]:
+        """Returns method, compression, data type and video of every directory.
+
+        The directories are <method dir>/<compression>/<data type>/<video>."""
+        if self._directory_attributes is None or len(
+            self._directory_attributes["video"]
+        ) != len(self.directories):
+            parts = [directory.split("/")[-4:] for directory in self.directories]
+            parts = np.array(parts, dtype=str).reshape(len(self.directories), 4)
+            self._directory_attributes = {
+                name: parts[:, i]
+                for i, name in enumerate(
+                    ["method", "compression", "data_type", "video"]
+                )
+            }
+        return self._directory_attributes
+
+    def query(
+        self,
+        methods: List[str] = None,
+        labels: List[Union[str, int]] = None,
+        videos: List[str] = None,
+        compressions: List[str] = None,
+        frames: Tuple[int, int] = None,
+    ) -> "FileList":
+        """Returns a view of this file list that only keeps the selected samples.
+
+        Every argument that is not None restricts the samples of all splits. The view
+        shares the samples and directories with this file list, only its samples_idx
+        are new. So it can be used like any other file list, e.g. with get_dataset.
+
+        Args:
+            methods: names of the methods, e.g. youtube or Deepfakes
+            labels: classes or their indices
+            videos: names of the video directories, e.g. 000 or 000_003
+            compressions: compressions, e.g. c40
+            frames: (start, stop) range of the frame numbers. For sequences the frame
+                number of the last frame of the window is used.
+
+        """
+        attributes = self._get_directory_attributes()
+        directory_mask = np.ones(len(self.directories), dtype=bool)
+        for name, values in [
+            ("method", methods),
+            ("video", videos),
+            ("compression", compressions),
+        ]:
+            if values is not None:
+                directory_mask &= np.isin(attributes[name], [str(v) for v in values])
+        if labels is not None:
+            labels = [self.class_to_idx.get(label, label) for label in labels]
+
+        view = copy.copy(self)
+        view.samples_idx = {}
+        for split, samples_idx in self.samples_idx.items():
+            samples = self.samples[split]
+            runs = samples.runs_of(samples_idx)
+            mask = directory_mask[samples.dir_ids[runs]]
+            if labels is not None:
+                mask &= np.isin(samples.labels[runs], labels)
+            if frames is not None:
+                frame_numbers = samples.first_frames[runs] + (
+                    samples_idx - samples.offsets[runs]
+                )
+                mask &= (frame_numbers >= frames[0]) & (frame_numbers < frames[1])
+            view.samples_idx[split] = samples_idx[mask]
+        return view
+
+    def _referenced_paths(self) -> List[str]:
+        """Returns the sorted paths of all frames that are part of a window of
+        min_sequence_length frames ending in a sample of samples_idx."""
+        paths = set()
+        for split, samples in self.samples.items():
+            indices = _referenced_frames(
+                self.samples_idx[split], max(self.min_sequence_length, 1)
+            )
+            runs = samples.runs_of(indices)
+            frames = samples.first_frames[runs] + (indices - samples.offsets[runs])
+            paths.update(
+                f"{self.directories[dir_id]}/{FRAME_NAME.format(frame)}"
+                for dir_id, frame in zip(
+                    samples.dir_ids[runs].tolist(), frames.tolist()
+                )
+            )
+        return sorted(paths)
+
+    def _referenced_video_files(self, directories: List[str]) -> List[str]:
+        """Returns the paths of the files of VIDEO_FILES and the mask files of
+        directories that exist below root."""
+        candidates = [
+            f"{directory}/{file_name}"
+            for directory in directories
+            for file_name in VIDEO_FILES
+        ]
+        candidates += dict.fromkeys(_mask_path(directory) for directory in directories)
+        return [path for path in candidates if os.path.exists(f"{self.root}/{path}")]
+
+    def copy_to(self, new_root: Path, num_threads: int = 16, link: str = None):
+        """Copies all frames that can be part of a sample to new_root and uses it as
+        root afterwards.
+
+        Only frames covered by a window of min_sequence_length frames ending in a
+        sample of samples_idx are copied, so datasets with a longer sequence_length
+        can't be loaded from new_root. The bounding box files (VIDEO_FILES) and mask
+        files of their videos are copied as well, so face_scale and masks work with
+        new_root. Files that already exist with the same size and
+        mtime are skipped, so an interrupted copy can be resumed.
+
+        Args:
+            new_root: target directory
+            num_threads: number of files copied concurrently
+            link: HARDLINK or REFLINK to link instead of copying files, if source
+                and target are on the same file system
+
+        """
         curr_root = Path(self.root)
-        for data_points in tqdm(self.samples.values(), position=0):
-            for data_point_path, _ in tqdm(data_points, position=1):
-                target_path = new_root / data_point_path
-                target_path.parents[0].mkdir(exist_ok=True, parents=True)
-                copy2(curr_root / data_point_path, target_path)
+        new_root = Path(new_root)
+        paths = self._referenced_paths()
+        directories = list(dict.fromkeys(path.rpartition("/")[0] for path in paths))
+        paths += self._referenced_video_files(directories)
+        for directory in dict.fromkeys(path.rpartition("/")[0] for path in paths):
+            (new_root / directory).mkdir(exist_ok=True, parents=True)
+
+        counts = {"copied": 0, "linked": 0, "skipped": 0}
+        nb_bytes = 0
+        start_time = time.time()
+        with ThreadPoolExecutor(max_workers=num_threads) as executor, tqdm(
+            unit="B", unit_scale=True, unit_divisor=1024
+        ) as progress:
+            for done, (action, size) in enumerate(
+                executor.map(
+                    lambda path: _copy_file(
+                        str(curr_root / path), str(new_root / path), link
+                    ),
+                    paths,
+                ),
+                start=1,
+            ):
+                counts[action] += 1
+                nb_bytes += size
+                progress.update(size)
+                progress.set_postfix(files=f"{done}/{len(paths)}", refresh=False)
+        duration = time.time() - start_time
 
+        logger.info(
+            f"{len(paths)} files ({nb_bytes / 1e6:.1f}MB) in {duration:.1f}s "
+            f"({nb_bytes / 1e6 / max(duration, 1e-9):.1f}MB/s): "
+            + ", ".join(f"{count} {action}" for action, count in counts.items())
+        )
         self.root = str(new_root)
         return self
 
-    def get_dataset(self, split, transform=None, sequence_length: int = 1) -> Dataset:
-        """Get dataset by using this instance."""
+    def get_dataset(
+        self,
+        split,
+        transform=None,
+        sequence_length: int = 1,
+        dataset_cls: Type["FileListDataset"] = None,
+        uint8_output: bool = False,
+        preload: bool = False,
+        preload_size: Tuple[int, int] = None,
+        decoder: str = PIL_DECODER,
+        statistics: Union[str, Path] = None,
+        **dataset_kwargs,
+    ) -> Dataset:
+        """Get dataset by using this instance.
+
+        Args:
+            split: split the dataset is built for (train, val, test)
+            transform: list of transforms applied before ToTensor and Normalize
+            sequence_length: number of consecutive frames returned per sample
+            dataset_cls: FileListDataset or one of its subclasses (e.g.
+                PackedFileListDataset). Defaults to FileListDataset.
+            uint8_output: if True samples are returned as uint8 tensors instead of
+                normalized float tensors. Use uint8_collate and BatchNormalize to
+                normalize whole batches.
+            preload: decode all frames of the dataset into memory right away (see
+                FileListDataset.preload)
+            preload_size: (height, width) the frames are resized to when preloading
+            decoder: image decoder, see faceforensics_internal.decoders. All decoders
+                but pil return arrays or tensors, so for them the frames are converted
+                to uint8 tensors first and transform has to work on tensors.
+            statistics: json file written by ChannelStatistics.save (see
+                compute_statistics). Its mean and std are used for normalization
+                instead of the ImageNet ones.
+            dataset_kwargs: additional arguments passed on to dataset_cls
+
+        """
         if sequence_length > self.min_sequence_length:
             logger.warning(
                 f"{sequence_length}>{self.min_sequence_length}. Trying to load data that"
                 f"does not exist might raise an error in the FileListDataset."
             )
+        mean, std = IMAGENET_MEAN, IMAGENET_STD
+        if statistics is not None:
+            mean, std = load_mean_std(statistics)
+        dataset_cls = dataset_cls or FileListDataset
         transform = transform or []
-        transform = transforms.Compose(
-            transform
-            + [
-                transforms.ToTensor(),
-                transforms.Normalize(
-                    mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225]
-                ),
-            ]
-        )
-        return FileListDataset(
+        if decoder != PIL_DECODER:
+            transform = [ToUint8Tensor()] + transform
+        elif transform:
+            # preloaded and packed frames are arrays, the given transforms expect PIL
+            # images
+            transform = [ArrayToPILImage()] + transform
+        if uint8_output:
+            transform = transforms.Compose(transform + [ToUint8Tensor()])
+        elif decoder != PIL_DECODER:
+            transform = transforms.Compose(
+                transform + [ToFloatTensor(), transforms.Normalize(mean=mean, std=std)]
+            )
+        else:
+            transform = transforms.Compose(
+                transform
+                + [transforms.ToTensor(), transforms.Normalize(mean=mean, std=std)]
+            )
+        if decoder != PIL_DECODER:
+            dataset_kwargs["decoder"] = decoder
+        dataset = dataset_cls(
             file_list=self,
             split=split,
             sequence_length=sequence_length,
             transform=transform,
+            **dataset_kwargs,
         )
+        if preload:
+            dataset.preload(size=preload_size)
+        return dataset
 
     @classmethod
     def get_dataset_form_file(
-        cls, path, split, transform=None, sequence_length: int = 1
+        cls,
+        path,
+        split,
+        transform=None,
+        sequence_length: int = 1,
+        dataset_cls: Type["FileListDataset"] = None,
+        **dataset_kwargs,
     ) -> Dataset:
         """Get dataset by loading a FileList and calling get_dataset on it."""
-        return cls.load(path).get_dataset(split, transform, sequence_length)
+        return cls.load(path).get_dataset(
+            split, transform, sequence_length, dataset_cls, **dataset_kwargs
+        )
 
     def __str__(self):
         return pformat(self.class_to_idx, indent=4)
@@ -123,7 +842,36 @@ class FileListDataset(VisionDataset):
     """Almost the same as DatasetFolder by pyTorch.
 
     But this one does not build up a file list by walking a folder. Instead this file
-    list has to be provided."""
+    list has to be provided.
+
+    If frame_cache_bytes > 0 decoded frames are kept in a LRUFrameCache of at most
+    this many bytes per worker, so that overlapping windows of neighbouring samples
+    don't decode the same frame again. self.frame_cache.stats() reports hits and
+    misses. Alternatively a cache can be passed as frame_cache, e.g. a
+    SharedFrameCache that is shared by all workers and by all datasets it is passed to.
+
+    A list of indices can be loaded at once with get_batch, either directly or by
+    passing a BatchSampler as sampler and batch_size=None to the DataLoader. Then each
+    frame of the batch is only loaded once and the batch is stacked right away. Newer
+    DataLoaders use __getitems__ for the same purpose.
+
+    After preload() all frames are served from memory.
+
+    With a LocalDiskCache as local_cache every file is copied to a local disk on its
+    first access and read from there afterwards.
+
+    decoder selects how the images are decoded (see faceforensics_internal.decoders).
+
+    If face_scale is set, every frame is cropped to the crop that
+    extract_faces_tracked_from_bounding_boxes would have extracted with this scale
+    (see utils._sub_crop_bbs). This works as long as the frames were extracted with a
+    larger scale, so different margins around the face can be used without extracting
+    the frames again.
+
+    With masks=True the target is (label, mask). mask is the uint8 mask of the
+    manipulated area (written by convert_masks) cropped like the frame, (H x W) or
+    (T x H x W) for sequences. Videos without mask file, e.g. real ones, get empty
+    masks. mask_transform is applied to the (H x W) mask of each frame."""
 
     def __init__(
         self,
@@ -132,37 +880,122 @@ class FileListDataset(VisionDataset):
         sequence_length: int,
         transform=None,
         target_transform=None,
+        frame_cache_bytes: int = 0,
+        frame_cache: Union[LRUFrameCache, SharedFrameCache] = None,
+        batch_threads: int = 8,
+        local_cache: LocalDiskCache = None,
+        decoder: str = PIL_DECODER,
+        face_scale: float = None,
+        masks: bool = False,
+        mask_transform=None,
     ):
         super().__init__(
             file_list.root, transform=transform, target_transform=target_transform
         )
-        self.loader = default_loader
+        self.decoder = decoder
+        self.loader = get_decoder(decoder)
+        if frame_cache is None and frame_cache_bytes > 0:
+            frame_cache = LRUFrameCache(frame_cache_bytes)
+        self.frame_cache = frame_cache
+        self.local_cache = local_cache
+        self.batch_threads = batch_threads
+        self._executor = None
+        self._executor_pid = None
 
         self.classes = file_list.classes
         self.class_to_idx = file_list.class_to_idx
         self._samples = file_list.samples[split]
         self.samples_idx = file_list.samples_idx[split]
-        self.targets = [s[1] for s in self._samples]
+        self.targets = self._samples.targets
         self.sequence_length = sequence_length
 
+        self._preloaded = None
+        self._preloaded_pos = None
+        self._preloaded_offsets = None
+        self._preloaded_shapes = None
+
+        self.face_scale = face_scale
+        self._sub_crop_bbs = {}
+
+        self.masks = masks
+        self.mask_transform = mask_transform
+        self._tracked_bbs = {}
+        self._mask_files = {}
+
     def __getitem__(self, index):
         """
         Args:
-            index (int): Index
+            index (int): Index. A list of indices is passed on to get_batch.
 
         Returns:
             tuple: (sample, target) where target is class_index of the target class.
         """
+        if isinstance(index, (list, tuple, np.ndarray)):
+            return self.get_batch(index)
+
+        start, stop = self._window(index)
+        return self._to_sample(
+            self._load_window(start, stop), self._target(start, stop)
+        )
+
+    def __getitems__(self, indices: List[int]) -> list:
+        """Used by the DataLoader to fetch all samples of a batch at once."""
+        samples, targets = self._load_batch(indices)
+        return list(zip(samples, targets))
+
+    def get_batch(self, indices: List[int]):
+        """Loads a whole batch of samples.
+
+        Every frame that is needed by some sample of the batch is only loaded once, in
+        parallel by batch_threads threads.
+
+        Returns:
+            tuple: (samples, targets) where samples are stacked to (B, C, H, W) or
+                (B, T, C, H, W) if sequence_length > 1.
+        """
+        samples, targets = self._load_batch(indices)
+        return torch.stack(samples, dim=0), default_collate(targets)
+
+    def _load_batch(self, indices: List[int]) -> Tuple[list, list]:
+        windows = [self._window(index) for index in indices]
+        frame_indices = sorted(
+            {frame for start, stop in windows for frame in range(start, stop)}
+        )
+        frames = dict(
+            zip(
+                frame_indices, self._get_executor().map(self._load_frame, frame_indices)
+            )
+        )
+
+        samples, targets = [], []
+        for start, stop in windows:
+            sample, target = self._to_sample(
+                [frames[frame] for frame in range(start, stop)],
+                self._target(start, stop),
+            )
+            samples.append(sample)
+            targets.append(target)
+        return samples, targets
+
+    def _window(self, index: int) -> Tuple[int, int]:
+        """Returns start and stop (exclusive) of the samples that belong to index."""
         try:
-            index = self.samples_idx[index]
+            index = int(self.samples_idx[index])
         except IndexError:
             logger.error(f"{index} is out of range {len(self.samples_idx)}")
-        samples = self._samples[
-            index - self.sequence_length + 1 : index + 1  # noqa: 203
-        ]
-        target = samples[0][1]
-        samples = [self.loader(f"{self.root}/{sample[0]}") for sample in samples]
+        return index - self.sequence_length + 1, index + 1
 
+    def _target(self, start: int, stop: int):
+        """Returns the label of the samples start to stop and their masks if needed."""
+        label = self._samples.label(start)
+        if not self.masks:
+            return label
+        masks = [self._load_mask(sample_index) for sample_index in range(start, stop)]
+        if self.sequence_length == 1:
+            return label, masks[0]
+        return label, torch.stack(masks, dim=0)
+
+    def _to_sample(self, samples: list, target: int):
         if self.transform is not None:
             samples = list(map(self.transform, samples))
 
@@ -176,5 +1009,187 @@ class FileListDataset(VisionDataset):
 
         return samples, target
 
+    def _get_executor(self) -> ThreadPoolExecutor:
+        # the threads of a pool created before forking don't exist in a worker
+        if self._executor is None or self._executor_pid != os.getpid():
+            self._executor = ThreadPoolExecutor(max_workers=self.batch_threads)
+            self._executor_pid = os.getpid()
+        return self._executor
+
+    def __getstate__(self):
+        # thread pools can't be pickled and are created again in each worker
+        state = self.__dict__.copy()
+        state["_executor"] = None
+        # memory maps would be pickled with their content
+        state["_mask_files"] = {}
+        return state
+
+    def get_video_ids(self) -> np.ndarray:
+        """Returns for each sample of the dataset the id of the directory (i.e. video)
+        it belongs to."""
+        return self._samples.dir_ids[self._samples.runs_of(self.samples_idx)]
+
+    def _load_window(self, start: int, stop: int) -> list:
+        """Loads the images of the samples start to stop (exclusive)."""
+        return [self._load_frame(sample_index) for sample_index in range(start, stop)]
+
+    def _load_frame(self, sample_index: int):
+        """Loads the image of a single sample."""
+        if self._preloaded is not None:
+            frame = self._preloaded_frame(sample_index)
+            if self.decoder == TORCHVISION_DECODER:
+                return torch.from_numpy(frame).permute(2, 0, 1)
+            return frame
+        image = self._load(self._samples.path(sample_index))
+        if self.face_scale is not None:
+            image = self._sub_crop(sample_index, image)
+        return image
+
+    def _sub_crop_bb(self, sample_index: int) -> List[int]:
+        """Returns the crop with face_scale inside of the image of sample_index."""
+        dir_id = int(self._samples.dir_ids[self._samples.run_of(sample_index)])
+        if dir_id not in self._sub_crop_bbs:
+            self._sub_crop_bbs[dir_id] = self._load_sub_crop_bbs(dir_id)
+        frame = self._samples.frame_number(sample_index)
+        return self._sub_crop_bbs[dir_id][f"{frame:04d}"]
+
+    def _sub_crop(self, sample_index: int, image):
+        """Crops image of sample_index to the crop with face_scale."""
+        bounding_box = self._sub_crop_bb(sample_index)
+        if bounding_box is None:
+            return image
+        return _crop(image, bounding_box)
+
+    def _get_mask_file(self, dir_id: int) -> MaskFile:
+        """Returns the mask file of the video of dir_id or None if there is none."""
+        if dir_id not in self._mask_files:
+            path = Path(self.root) / _mask_path(self._samples.directories[dir_id])
+            self._mask_files[dir_id] = MaskFile(path) if path.exists() else None
+        return self._mask_files[dir_id]
+
+    def _load_mask(self, sample_index: int) -> torch.Tensor:
+        """Loads the mask of sample_index, cropped to the tracked bounding box."""
+        dir_id = int(self._samples.dir_ids[self._samples.run_of(sample_index)])
+        if dir_id not in self._tracked_bbs:
+            directory = Path(self.root) / self._samples.directories[dir_id]
+            with open(directory / "tracked_bb.json", "r") as f:
+                self._tracked_bbs[dir_id] = json.load(f)
+        frame = self._samples.frame_number(sample_index)
+        # crops clamped at the border of the frame have float sizes
+        x, y, w, h = (int(value) for value in self._tracked_bbs[dir_id][f"{frame:04d}"])
+        if self.face_scale is not None:
+            sub_x, sub_y, w, h = self._sub_crop_bb(sample_index)
+            x, y = x + sub_x, y + sub_y
+
+        mask_file = self._get_mask_file(dir_id)
+        if mask_file is None or frame >= len(mask_file):
+            mask = np.zeros((h, w), dtype=np.uint8)
+        else:
+            mask = mask_file.crop(frame, [x, y, w, h]).astype(np.uint8)
+        mask = torch.from_numpy(mask)
+        if self.mask_transform is not None:
+            mask = self.mask_transform(mask)
+        return mask
+
+    def _load_sub_crop_bbs(self, dir_id: int) -> dict:
+        video_dir = Path(self.root) / self._samples.directories[dir_id]
+        with open(video_dir / "tracked_bb.json", "r") as f:
+            tracked_bb = json.load(f)
+        with open(video_dir / "relative_bb.json", "r") as f:
+            relative_bb = json.load(f)
+        try:
+            with open(video_dir / "crop_scale.json", "r") as f:
+                crop_scale = json.load(f)["scale"]
+        except FileNotFoundError:
+            # extracted before the scale was saved, i.e. with scale 1
+            crop_scale = 1
+        if self.face_scale > crop_scale:
+            logger.warning(
+                f"{video_dir} was extracted with scale {crop_scale}<{self.face_scale}. "
+                f"The crops are limited to the stored ones."
+            )
+        return _sub_crop_bbs(tracked_bb, relative_bb, self.face_scale)
+
+    def preload(self, size: Tuple[int, int] = None, num_threads: int = 8):
+        """Decodes every frame that can be reached by a sample into memory.
+
+        The frames are decoded by num_threads threads and stored in one contiguous
+        uint8 array. Afterwards frames are returned as views of this array, (H x W x 3)
+        arrays or (3 x H x W) tensors for the torchvision decoder, without copying
+        them. The dataset should be passed to the DataLoader workers by fork, which
+        shares the array between the processes.
+
+        Args:
+            size: (height, width) every frame is resized to. Then the frames are
+                stored as (N, height, width, 3) array. Otherwise they are stored back
+                to back in a flat array.
+            num_threads: number of threads used for decoding
+
+        """
+        start_time = time.time()
+        frames = _referenced_frames(self.samples_idx, self.sequence_length)
+
+        def _decode(sample_index):
+            image = to_rgb_array(self._read(self._samples.path(sample_index)))
+            if self.face_scale is not None:
+                image = self._sub_crop(sample_index, image)
+            if size is not None:
+                image = transforms.functional.resize(Image.fromarray(image), size)
+            return np.asarray(image, dtype=np.uint8)
+
+        self._preloaded = None
+        self._preloaded_offsets = None
+        with ThreadPoolExecutor(max_workers=num_threads) as executor:
+            images = list(tqdm(executor.map(_decode, frames), total=len(frames)))
+
+        self._preloaded_pos = np.full(len(self._samples), -1, dtype=np.int64)
+        self._preloaded_pos[frames] = np.arange(len(frames))
+        self._preloaded_shapes = np.array(
+            [image.shape for image in images], dtype=np.int64
+        ).reshape(-1, 3)
+        if not images:
+            self._preloaded = np.empty(0, dtype=np.uint8)
+        elif size is not None:
+            self._preloaded = np.stack(images)
+        else:
+            self._preloaded_offsets = np.concatenate(
+                [[0], np.cumsum(np.prod(self._preloaded_shapes, axis=1))]
+            )
+            self._preloaded = np.concatenate([image.reshape(-1) for image in images])
+        del images
+
+        duration = time.time() - start_time
+        self.preload_stats = {
+            "frames": len(frames),
+            "seconds": duration,
+            "frames_per_second": len(frames) / duration if duration else 0.0,
+            "bytes": self._preloaded.nbytes,
+        }
+        logger.info(
+            f"Preloaded {len(frames)} frames in {duration:.1f}s "
+            f"({self.preload_stats['frames_per_second']:.0f} frames/s), "
+            f"{self._preloaded.nbytes / 2 ** 20:.1f} MiB in memory."
+        )
+
+    def _preloaded_frame(self, sample_index: int) -> np.ndarray:
+        pos = self._preloaded_pos[sample_index]
+        if pos < 0:
+            raise KeyError(f"Sample {sample_index} was not preloaded.")
+        if self._preloaded.ndim == 4:
+            return self._preloaded[pos]
+        start, end = self._preloaded_offsets[pos], self._preloaded_offsets[pos + 1]
+        return self._preloaded[start:end].reshape(self._preloaded_shapes[pos])
+
+    def _load(self, sample_path: str):
+        if self.frame_cache is None:
+            return self._read(sample_path)
+        return self.frame_cache.get(sample_path, lambda: self._read(sample_path))
+
+    def _read(self, sample_path: str):
+        """Reads the image of sample_path from disk."""
+        if self.local_cache is not None:
+            return self.local_cache.load(self.root, sample_path, self.loader)
+        return self.loader(f"{self.root}/{sample_path}")
+
     def __len__(self):
         return len(self.samples_idx)
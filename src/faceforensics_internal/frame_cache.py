@@ -0,0 +1,372 @@
+import fcntl
+import hashlib
+import mmap
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable
+from typing import Hashable
+
+import numpy as np
+from PIL import Image
+
+
+def frame_nbytes(frame) -> int:
+    """Returns the number of bytes a decoded frame (PIL image or array) occupies."""
+    if isinstance(frame, Image.Image):
+        return frame.width * frame.height * len(frame.getbands())
+    return np.asarray(frame).nbytes
+
+
+class LRUFrameCache:
+    """Bounded cache of decoded frames with least-recently-used eviction.
+
+    Every process gets its own, initially empty cache: the cached frames are not pickled
+    when the dataset is sent to a DataLoader worker. hits and misses count the lookups
+    of the current process."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._frames = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, load: Callable):
+        """Returns the frame stored for key. If it is missing it's loaded with load()
+        and added to the cache."""
+        with self._lock:
+            try:
+                frame, _ = self._frames[key]
+                self._frames.move_to_end(key)
+                self.hits += 1
+                return frame
+            except KeyError:
+                self.misses += 1
+
+        frame = load()
+        self.put(key, frame)
+        return frame
+
+    def put(self, key: Hashable, frame):
+        nbytes = frame_nbytes(frame)
+        if nbytes > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._frames:
+                return
+            self._frames[key] = frame, nbytes
+            self.current_bytes += nbytes
+            while self.current_bytes > self.max_bytes:
+                _, (_, evicted_nbytes) = self._frames.popitem(last=False)
+                self.current_bytes -= evicted_nbytes
+
+    def clear(self):
+        with self._lock:
+            self._frames.clear()
+            self.current_bytes = 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hit_rate,
+            "frames": len(self._frames),
+            "bytes": self.current_bytes,
+            "max_bytes": self.max_bytes,
+        }
+
+    def __len__(self):
+        return len(self._frames)
+
+    def __getstate__(self):
+        return {"max_bytes": self.max_bytes}
+
+    def __setstate__(self, state):
+        self.__init__(state["max_bytes"])
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.stats()})"
+
+
+SHARED_CACHE_MAGIC = 0x4646464341434845
+_HEADER = ["magic", "capacity", "num_slots", "write_pos", "hits", "misses"]
+_HEADER_BYTES = 64
+_SLOT_DTYPE = np.dtype(
+    [
+        ("key", np.uint64),
+        ("pos", np.uint64),
+        ("nbytes", np.uint64),
+        ("height", np.uint32),
+        ("width", np.uint32),
+        ("channels", np.uint32),
+        ("is_pil", np.uint32),
+    ]
+)
+_PIL_MODES = {1: "L", 3: "RGB", 4: "RGBA"}
+
+
+def _key_hash(key: Hashable) -> int:
+    """Hash of key that is the same in every process (unlike hash())."""
+    digest = hashlib.blake2b(str(key).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "little") or 1
+
+
+def _default_cache_dir() -> str:
+    return "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+
+
+class SharedFrameCache:
+    """Cache of decoded uint8 frames in a memory-mapped file shared by all processes.
+
+    All DataLoader workers (and all datasets the same instance is passed to, e.g. the
+    train and the val dataset) see the same entries. The file is placed in /dev/shm if
+    available, i.e. it lives in shared memory.
+
+    The frames are written into a ring buffer of max_bytes, so the oldest frames are
+    evicted first. An index of num_slots entries maps the hash of a key to the position
+    of its frame. Accesses are serialized with a file lock.
+
+    hits and misses count the lookups of the current process, stats() also reports
+    the counts of all processes.
+
+    Args:
+        max_bytes: size of the ring buffer holding the frames
+        path: file backing the cache. If it exists, the cache attaches to it.
+            Otherwise it is created and removed again when this instance is deleted.
+        num_slots: number of index entries, defaults to one per 4 KiB of max_bytes
+
+    """
+
+    _probe_length = 8
+
+    def __init__(self, max_bytes: int, path: str = None, num_slots: int = None):
+        self.max_bytes = max_bytes
+        self.num_slots = num_slots or max(max_bytes // 2 ** 12, self._probe_length)
+        self.hits = 0
+        self.misses = 0
+
+        self._owner_pid = None
+        if path is None:
+            fd, path = tempfile.mkstemp(
+                prefix="frame_cache_", suffix=".bin", dir=_default_cache_dir()
+            )
+            os.close(fd)
+            self._create(path)
+        elif not os.path.exists(path):
+            self._create(path)
+        self.path = path
+
+        self._pid = None
+        self._thread_lock = threading.Lock()
+        self._attach()
+        if self._header("magic") != SHARED_CACHE_MAGIC:
+            raise ValueError(f"{path} is not a frame cache.")
+        self.max_bytes = self._header("capacity")
+        self.num_slots = self._header("num_slots")
+
+    def _create(self, path: str):
+        size = _HEADER_BYTES + self.num_slots * _SLOT_DTYPE.itemsize + self.max_bytes
+        with open(path, "wb") as f:
+            f.truncate(size)
+            header = np.zeros(_HEADER_BYTES // 8, dtype=np.uint64)
+            header[: len(_HEADER)] = [
+                SHARED_CACHE_MAGIC,
+                self.max_bytes,
+                self.num_slots,
+                0,
+                0,
+                0,
+            ]
+            f.write(header.tobytes())
+        self._owner_pid = os.getpid()
+
+    def _attach(self):
+        """Maps the file. Has to happen again in every process, as locks that are
+        inherited by fork would be shared with the parent."""
+        if self._pid == os.getpid():
+            return
+        self._file = open(self.path, "r+b")
+        self._mmap = mmap.mmap(self._file.fileno(), 0)
+        self._header_array = np.ndarray(
+            (_HEADER_BYTES // 8,), dtype=np.uint64, buffer=self._mmap
+        )
+        num_slots = int(self._header_array[_HEADER.index("num_slots")])
+        self._slots = np.ndarray(
+            (num_slots,), dtype=_SLOT_DTYPE, buffer=self._mmap, offset=_HEADER_BYTES
+        )
+        self._data = np.ndarray(
+            (int(self._header_array[_HEADER.index("capacity")]),),
+            dtype=np.uint8,
+            buffer=self._mmap,
+            offset=_HEADER_BYTES + self._slots.nbytes,
+        )
+        self._pid = os.getpid()
+
+    def _header(self, name: str) -> int:
+        return int(self._header_array[_HEADER.index(name)])
+
+    def _set_header(self, name: str, value: int):
+        self._header_array[_HEADER.index(name)] = value
+
+    @contextmanager
+    def _locked(self):
+        self._attach()
+        with self._thread_lock:
+            fcntl.flock(self._file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._file, fcntl.LOCK_UN)
+
+    def _probe(self, key_hash: int):
+        return [(key_hash + i) % self.num_slots for i in range(self._probe_length)]
+
+    def _is_valid(self, slot) -> bool:
+        # the ring buffer has not been overwritten since the frame was written
+        write_pos = self._header("write_pos")
+        return slot["key"] != 0 and write_pos <= int(slot["pos"]) + self.max_bytes
+
+    def _lookup(self, key_hash: int):
+        """Returns the stored frame and whether it was a PIL image or None."""
+        with self._locked():
+            for slot_idx in self._probe(key_hash):
+                slot = self._slots[slot_idx]
+                if slot["key"] == key_hash and self._is_valid(slot):
+                    self._set_header("hits", self._header("hits") + 1)
+                    start = int(slot["pos"]) % self.max_bytes
+                    end = start + int(slot["nbytes"])
+                    frame = self._data[start:end].reshape(
+                        int(slot["height"]), int(slot["width"]), int(slot["channels"])
+                    )
+                    return frame.copy(), bool(slot["is_pil"])
+            self._set_header("misses", self._header("misses") + 1)
+        return None
+
+    def get(self, key: Hashable, load: Callable):
+        """Returns the frame stored for key. If it is missing it's loaded with load()
+        and added to the cache."""
+        entry = self._lookup(_key_hash(key))
+        if entry is not None:
+            self.hits += 1
+            frame, is_pil = entry
+            if is_pil:
+                return Image.fromarray(frame[:, :, 0] if frame.shape[2] == 1 else frame)
+            return frame
+
+        self.misses += 1
+        frame = load()
+        self.put(key, frame)
+        return frame
+
+    def put(self, key: Hashable, frame):
+        is_pil = isinstance(frame, Image.Image)
+        if is_pil and frame.mode not in _PIL_MODES.values():
+            return
+        if not is_pil and not isinstance(frame, np.ndarray):
+            # e.g. (C x H x W) tensors, they would come back as arrays
+            return
+        array = np.asarray(frame, dtype=np.uint8)
+        if array.ndim == 2:
+            array = array[:, :, None]
+        if array.ndim != 3 or array.nbytes > self.max_bytes:
+            return
+
+        key_hash = _key_hash(key)
+        with self._locked():
+            # pick a free, stale or the oldest slot
+            candidates = self._probe(key_hash)
+            slot_idx = min(
+                candidates,
+                key=lambda idx: (
+                    self._slots[idx]["key"] != key_hash,
+                    self._is_valid(self._slots[idx]),
+                    int(self._slots[idx]["pos"]),
+                ),
+            )
+
+            write_pos = self._header("write_pos")
+            start = write_pos % self.max_bytes
+            if start + array.nbytes > self.max_bytes:
+                # frames are not split, continue at the beginning of the ring buffer
+                write_pos += self.max_bytes - start
+                start = 0
+            self._data[start : start + array.nbytes] = array.reshape(-1)  # noqa E203
+            self._slots[slot_idx] = (
+                key_hash,
+                write_pos,
+                array.nbytes,
+                array.shape[0],
+                array.shape[1],
+                array.shape[2],
+                is_pil,
+            )
+            self._set_header("write_pos", write_pos + array.nbytes)
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self) -> dict:
+        with self._locked():
+            frames = sum(
+                1 for slot in self._slots if slot["key"] != 0 and self._is_valid(slot)
+            )
+            total_hits, total_misses = self._header("hits"), self._header("misses")
+            write_pos = self._header("write_pos")
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hit_rate,
+            "total_hits": total_hits,
+            "total_misses": total_misses,
+            "frames": frames,
+            "bytes": min(write_pos, self.max_bytes),
+            "max_bytes": self.max_bytes,
+        }
+
+    def close(self):
+        """Unmaps the file and removes it if this instance created it."""
+        if self._pid == os.getpid():
+            self._header_array = self._slots = self._data = None
+            self._mmap.close()
+            self._file.close()
+            self._pid = None
+        if self._owner_pid == os.getpid() and os.path.exists(self.path):
+            os.remove(self.path)
+        self._owner_pid = None
+
+    def __del__(self):
+        try:
+            self.close()
+        except (AttributeError, BufferError, OSError):
+            pass
+
+    def __getstate__(self):
+        return {
+            "path": self.path,
+            "max_bytes": self.max_bytes,
+            "num_slots": self.num_slots,
+        }
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.hits = 0
+        self.misses = 0
+        self._owner_pid = None
+        self._pid = None
+        self._thread_lock = threading.Lock()
+        self._attach()
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.path}, {self.stats()})"
@@ -0,0 +1,213 @@
+"""Read-through cache of dataset files on a local disk."""
+import fcntl
+import logging
+import os
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable
+
+logger = logging.getLogger(__file__)
+
+_LOCK = ".lock"
+_EVICT_LOCK = ".evict.lock"
+_SIZE = ".size"
+_TMP_PREFIX = ".tmp-"
+
+
+def _remove(path: str) -> bool:
+    """Removes path, returns False if it didn't exist."""
+    try:
+        os.remove(path)
+        return True
+    except FileNotFoundError:
+        return False
+
+
+def _is_stale_tmp(file_name: str) -> bool:
+    """Whether file_name is a temporary file of a process that doesn't exist anymore."""
+    try:
+        pid = int(file_name[len(_TMP_PREFIX) :].split("-", 1)[0])  # noqa E203
+    except ValueError:
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return True
+    except PermissionError:
+        pass
+    return False
+
+
+class LocalDiskCache:
+    """Copies files to cache_dir on their first access and reads them from there later.
+
+    Meant for datasets on a slow (network) filesystem and nodes with a fast local disk.
+    Files are copied to a temporary file and renamed, so a file in the cache is always
+    complete. The size of the cache is tracked in cache_dir/.size. If it gets bigger
+    than max_bytes, the least recently used files (by modification time, which is
+    updated on access at most every touch_interval seconds) are deleted until the
+    cache is below low_watermark * max_bytes. Size bookkeeping and deletions happen
+    under a file lock, so any number of workers and processes on the same node can use
+    the same cache_dir. The cache is scanned for eviction by one process at a time and
+    without holding that lock, so the other processes can go on copying files.
+    Temporary files left behind by killed processes are deleted by the scan.
+
+    Use one cache_dir per dataset root, as files are stored by their path relative to
+    the root.
+
+    Args:
+        cache_dir: directory on the local disk
+        max_bytes: maximal size of the cache
+        low_watermark: fraction of max_bytes the cache is reduced to when evicting
+        touch_interval: minimal number of seconds between two updates of the
+            modification time of a cached file
+
+    """
+
+    def __init__(
+        self,
+        cache_dir: str,
+        max_bytes: int,
+        low_watermark: float = 0.9,
+        touch_interval: float = 60.0,
+    ):
+        self.cache_dir = str(cache_dir)
+        self.max_bytes = max_bytes
+        self.low_watermark = low_watermark
+        self.touch_interval = touch_interval
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        with self._locked():
+            if not os.path.exists(self._size_path):
+                self._write_size(self._scan()[1])
+
+    @property
+    def _size_path(self) -> str:
+        return os.path.join(self.cache_dir, _SIZE)
+
+    @contextmanager
+    def _locked(self, name: str = _LOCK, blocking: bool = True):
+        """Holds the file lock cache_dir/name. Yields whether it was acquired, which is
+        only False if blocking is False and another process holds the lock."""
+        with open(os.path.join(self.cache_dir, name), "a") as lock_file:
+            try:
+                fcntl.flock(
+                    lock_file,
+                    fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB,
+                )
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read_size(self) -> int:
+        try:
+            with open(self._size_path, "r") as f:
+                return int(f.read() or 0)
+        except FileNotFoundError:
+            return 0
+
+    def _write_size(self, size: int):
+        with open(self._size_path, "w") as f:
+            f.write(str(size))
+
+    def _scan(self):
+        """Returns (mtime, size, path) of all cached files and their total size.
+        Deletes stale temporary files."""
+        files = []
+        for directory, _, file_names in os.walk(self.cache_dir):
+            for file_name in file_names:
+                path = os.path.join(directory, file_name)
+                if file_name.startswith(_TMP_PREFIX):
+                    if _is_stale_tmp(file_name):
+                        # the process was killed while copying
+                        _remove(path)
+                    continue
+                if file_name.startswith("."):
+                    continue
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+        return files, sum(size for _, size, _ in files)
+
+    def _evict(self):
+        """Deletes the least recently used files. Has to be called without the lock.
+
+        Files copied by other processes during the scan are only counted by the next
+        eviction."""
+        with self._locked(_EVICT_LOCK, blocking=False) as acquired:
+            if not acquired:
+                # another process is evicting already
+                return
+            files, size = self._scan()
+            target_size = self.low_watermark * self.max_bytes
+            nb_evicted = 0
+            with self._locked():
+                for _, file_size, path in sorted(files):
+                    if size <= target_size:
+                        break
+                    if _remove(path):
+                        nb_evicted += 1
+                    size -= file_size
+                self._write_size(size)
+        logger.info(f"Evicted {nb_evicted} files from {self.cache_dir}.")
+
+    def _fetch(self, root: str, sample_path: str) -> str:
+        """Returns the local path of sample_path. Copies it if it's not cached yet."""
+        local_path = os.path.join(self.cache_dir, sample_path)
+        try:
+            mtime = os.stat(local_path).st_mtime
+            if time.time() - mtime > self.touch_interval:
+                os.utime(local_path)
+            return local_path
+        except FileNotFoundError:
+            pass
+
+        local_dir, file_name = os.path.split(local_path)
+        os.makedirs(local_dir, exist_ok=True)
+        tmp_path = os.path.join(
+            local_dir, f"{_TMP_PREFIX}{os.getpid()}-{threading.get_ident()}-{file_name}"
+        )
+        try:
+            shutil.copyfile(os.path.join(root, sample_path), tmp_path)
+        except BaseException:
+            _remove(tmp_path)
+            raise
+        size = os.path.getsize(tmp_path)
+
+        with self._locked():
+            if os.path.exists(local_path):
+                # another process was faster
+                os.remove(tmp_path)
+                return local_path
+            os.replace(tmp_path, local_path)
+            total_size = self._read_size() + size
+            self._write_size(total_size)
+        if total_size > self.max_bytes:
+            self._evict()
+        return local_path
+
+    def load(self, root: str, sample_path: str, loader: Callable):
+        """Loads root/sample_path with loader from the local copy."""
+        try:
+            return loader(self._fetch(root, sample_path))
+        except FileNotFoundError:
+            # evicted by another process between fetching and loading
+            return loader(self._fetch(root, sample_path))
+
+    def size(self) -> int:
+        with self._locked():
+            return self._read_size()
+
+    def __repr__(self):
+        return (
+            f"{self.__class__.__name__}({self.cache_dir}, "
+            f"{self.size()}/{self.max_bytes} bytes)"
+        )
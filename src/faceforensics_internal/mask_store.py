@@ -0,0 +1,123 @@
+"""Run-length encoded binary masks, stored in one indexed file per video.
+
+File layout (little endian):
+    magic (8 bytes), height, width, number of frames (uint32 each), padding to 8 bytes
+    offsets: uint64[number of frames + 1], index of the first run of every frame
+    runs: uint32[offsets[-1]], alternating lengths of 0 and 1 runs of the flattened
+        (row major) mask of each frame, always starting with a (possibly empty) 0 run
+
+The file is memory-mapped, so reading a mask only touches its runs. Masks can be
+decoded partially, e.g. only the rows of a bounding box.
+"""
+from pathlib import Path
+from typing import Iterable
+from typing import List
+from typing import Union
+
+import numpy as np
+
+MASK_MAGIC = b"FFRLE001"
+MASK_SUFFIX = ".rle"
+_HEADER_DTYPE = np.dtype([("height", "<u4"), ("width", "<u4"), ("num_frames", "<u4")])
+_HEADER_SIZE = 24
+
+
+def encode_mask(mask: np.ndarray) -> np.ndarray:
+    """Returns the run lengths of the flattened binary mask, starting with a 0 run."""
+    flat = np.asarray(mask, dtype=bool).reshape(-1)
+    changes = np.flatnonzero(flat[1:] != flat[:-1]) + 1
+    boundaries = np.concatenate([[0], changes, [len(flat)]])
+    runs = np.diff(boundaries)
+    if len(flat) > 0 and flat[0]:
+        runs = np.concatenate([[0], runs])
+    return runs.astype(np.uint32)
+
+
+def decode_mask(runs: np.ndarray, height: int, width: int) -> np.ndarray:
+    """Inverse of encode_mask, returns a (height x width) bool array."""
+    values = np.arange(len(runs)) % 2 == 1
+    return np.repeat(values, runs).reshape(height, width)
+
+
+def write_masks(path: Union[str, Path], masks: Iterable[np.ndarray]):
+    """Writes the binary (H x W) masks of all frames of a video to path."""
+    runs = []
+    height, width = 0, 0
+    for mask in masks:
+        height, width = mask.shape[:2]
+        runs.append(encode_mask(mask))
+    offsets = np.concatenate([[0], np.cumsum([len(r) for r in runs])]).astype("<u8")
+
+    header = np.array([(height, width, len(runs))], dtype=_HEADER_DTYPE)
+    with open(path, "wb") as f:
+        f.write(MASK_MAGIC)
+        f.write(header.tobytes().ljust(_HEADER_SIZE - len(MASK_MAGIC), b"\0"))
+        f.write(offsets.tobytes())
+        f.write(np.concatenate([np.array([], dtype=np.uint32)] + runs).tobytes())
+
+
+class MaskFile:
+    """Reads the masks of a file written by write_masks.
+
+    Args:
+        path: path of the file
+
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        with open(self.path, "rb") as f:
+            if f.read(len(MASK_MAGIC)) != MASK_MAGIC:
+                raise ValueError(f"{self.path} is not a mask file.")
+            header = np.frombuffer(f.read(_HEADER_DTYPE.itemsize), _HEADER_DTYPE)[0]
+        self.height = int(header["height"])
+        self.width = int(header["width"])
+        self.num_frames = int(header["num_frames"])
+
+        self._offsets = np.memmap(
+            self.path,
+            dtype="<u8",
+            mode="r",
+            offset=_HEADER_SIZE,
+            shape=(self.num_frames + 1,),
+        )
+        nb_runs = int(self._offsets[-1])
+        self._runs = (
+            np.memmap(
+                self.path,
+                dtype="<u4",
+                mode="r",
+                offset=_HEADER_SIZE + self._offsets.nbytes,
+                shape=(nb_runs,),
+            )
+            if nb_runs > 0
+            else np.array([], dtype=np.uint32)
+        )
+
+    def _frame_runs(self, frame: int) -> np.ndarray:
+        return self._runs[self._offsets[frame] : self._offsets[frame + 1]]  # noqa E203
+
+    def __getitem__(self, frame: int) -> np.ndarray:
+        """Returns the (H x W) bool mask of frame."""
+        return decode_mask(self._frame_runs(frame), self.height, self.width)
+
+    def crop(self, frame: int, bounding_box: List[int]) -> np.ndarray:
+        """Returns the mask of frame inside bounding_box (x, y, w, h).
+
+        Only the runs of the rows of the bounding box are decoded."""
+        x, y, w, h = (int(value) for value in bounding_box)
+        runs = self._frame_runs(frame).astype(np.int64)
+        ends = np.cumsum(runs)
+        starts = ends - runs
+
+        # clip the runs to the pixels of the rows y to y + h
+        first, last = y * self.width, (y + h) * self.width
+        lo = np.searchsorted(ends, first, side="right")
+        hi = np.searchsorted(starts, last, side="left")
+        lengths = np.minimum(ends[lo:hi], last) - np.maximum(starts[lo:hi], first)
+        values = np.arange(lo, hi) % 2 == 1
+        rows = np.repeat(values, lengths).reshape(h, self.width)
+        return rows[:, x : x + w]  # noqa E203
+
+    def __len__(self):
+        return self.num_frames
@@ -0,0 +1,223 @@
+"""Packed storage of the frames referenced by a FileList.
+
+Instead of one png per frame, all decoded frames (uint8, RGB, HWC) that can be reached
+by a sampled window are written back to back into a few large shard files. For every
+split an index with one row (shard, offset, height, width) per entry in
+FileList.samples[split] is stored next to them. Frames that are not referenced have
+shard -1.
+
+Frames are written in sample order and a shard is only closed at the start of a new run
+of consecutive samples, so every window of a sequence lies contiguously in one shard.
+"""
+import json
+import logging
+from multiprocessing.pool import ThreadPool
+from pathlib import Path
+from typing import Iterable
+from typing import List
+from typing import Union
+
+import numpy as np
+from torchvision.datasets.folder import default_loader
+from tqdm import tqdm
+
+from faceforensics_internal.file_list_dataset import _referenced_frames
+from faceforensics_internal.file_list_dataset import FileList
+from faceforensics_internal.file_list_dataset import FileListDataset
+from faceforensics_internal.splits import TEST_NAME
+from faceforensics_internal.splits import TRAIN_NAME
+from faceforensics_internal.splits import VAL_NAME
+
+logger = logging.getLogger(__file__)
+
+PACK_META = "pack.json"
+SHARD_NAME = "shard_{:05d}.bin"
+
+
+def _decode(path: str) -> np.ndarray:
+    return np.asarray(default_loader(path))
+
+
+def pack_file_list(
+    file_list: FileList,
+    output_dir: Path,
+    splits: Iterable[str] = (TRAIN_NAME, VAL_NAME, TEST_NAME),
+    sequence_length: int = None,
+    shard_size: int = 2 ** 30,
+    num_threads: int = 8,
+):
+    """Packs all frames referenced by file_list into shard files in output_dir.
+
+    Args:
+        file_list: file list whose samples should be packed
+        output_dir: directory the shards, indices and meta data are written to
+        splits: splits that should be packed
+        sequence_length: longest window that should be readable from the shards.
+            Defaults to file_list.min_sequence_length.
+        shard_size: size in bytes after which a new shard is started
+        num_threads: number of threads used for decoding the images
+
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    sequence_length = sequence_length or file_list.min_sequence_length
+
+    shards = []
+    shard_file = None
+    shard_offset = 0
+
+    with ThreadPool(num_threads) as pool:
+        for split in splits:
+            samples = file_list.samples[split]
+            index = np.full((len(samples), 4), -1, dtype=np.int64)
+            frames = _referenced_frames(file_list.samples_idx[split], sequence_length)
+            paths = [f"{file_list.root}/{samples.path(frame)}" for frame in frames]
+
+            last_frame = None
+            images = pool.imap(_decode, paths, chunksize=16)
+            for frame, image in tqdm(zip(frames, images), total=len(frames)):
+                new_run = last_frame is None or frame != last_frame + 1
+                if shard_file is None or (new_run and shard_offset >= shard_size):
+                    if shard_file is not None:
+                        shard_file.close()
+                    shards.append(SHARD_NAME.format(len(shards)))
+                    shard_file = open(output_dir / shards[-1], "wb")
+                    shard_offset = 0
+
+                image = np.ascontiguousarray(image, dtype=np.uint8)
+                shard_file.write(image.tobytes())
+                index[frame] = len(shards) - 1, shard_offset, *image.shape[:2]
+                shard_offset += image.nbytes
+                last_frame = frame
+
+            np.save(output_dir / f"{split}.npy", index)
+            logger.info(f"Packed {len(frames)} frames of {split}.")
+
+    if shard_file is not None:
+        shard_file.close()
+
+    with open(output_dir / PACK_META, "w") as f:
+        json.dump(
+            {
+                "root": file_list.root,
+                "sequence_length": sequence_length,
+                "splits": list(splits),
+                "shards": shards,
+            },
+            f,
+        )
+    logger.info(f"{output_dir} created with {len(shards)} shards.")
+
+
+class PackedFileListDataset(FileListDataset):
+    """FileListDataset that reads frames from shards created by pack_file_list.
+
+    The shards are memory-mapped lazily in each process, so the dataset can be passed
+    to DataLoader workers. The frames are passed to transform as read-only
+    (H x W x 3) uint8 views of the shards, like the arrays of the cv2 decoder. For the
+    pil decoder FileList.get_dataset converts them to PIL images only before the given
+    transforms.
+
+    The other keyword arguments are passed to FileListDataset. Frame caches and
+    local_cache are not supported, as the frames already are in memory-mapped files.
+    """
+
+    def __init__(
+        self,
+        file_list: FileList,
+        split: str,
+        sequence_length: int,
+        packed_dir: Union[str, Path],
+        transform=None,
+        target_transform=None,
+        **dataset_kwargs,
+    ):
+        unsupported = [
+            name
+            for name in ["frame_cache_bytes", "frame_cache", "local_cache"]
+            if dataset_kwargs.get(name)
+        ]
+        if unsupported:
+            raise ValueError(
+                f"{', '.join(unsupported)} can't be used with {type(self).__name__}, "
+                f"the frames are read from memory-mapped shards."
+            )
+        super().__init__(
+            file_list,
+            split,
+            sequence_length,
+            transform=transform,
+            target_transform=target_transform,
+            **dataset_kwargs,
+        )
+        self.packed_dir = Path(packed_dir)
+        with open(self.packed_dir / PACK_META, "r") as f:
+            meta = json.load(f)
+        if split not in meta["splits"]:
+            raise ValueError(f"{split} was not packed into {self.packed_dir}.")
+        if sequence_length > meta["sequence_length"]:
+            logger.warning(
+                f"{sequence_length}>{meta['sequence_length']}. Some windows might not "
+                f"have been packed."
+            )
+
+        self._shard_names = meta["shards"]
+        self._index = np.load(self.packed_dir / f"{split}.npy")
+        self._shards = None
+
+    def __getstate__(self):
+        # memory maps are opened again in each worker
+        state = super().__getstate__()
+        state["_shards"] = None
+        return state
+
+    def _get_shards(self) -> List[np.memmap]:
+        if self._shards is None:
+            self._shards = [
+                np.memmap(self.packed_dir / name, dtype=np.uint8, mode="r")
+                for name in self._shard_names
+            ]
+        return self._shards
+
+    def get_frames(self, start: int, stop: int) -> Union[np.ndarray, List[np.ndarray]]:
+        """Returns zero-copy views of the frames start to stop (exclusive).
+
+        If the frames lie contiguously in one shard and have the same size, a single
+        (T, H, W, C) view is returned. Otherwise a list of (H, W, C) views.
+        """
+        entries = self._index[start:stop]
+        if len(entries) == 0 or (entries[:, 0] < 0).any():
+            raise KeyError(
+                f"Samples {start}:{stop} are not packed in {self.packed_dir}"
+            )
+
+        shards = self._get_shards()
+        shard, offset, height, width = entries[0]
+        frame_size = height * width * 3
+        end = offset + frame_size * len(entries)
+        if (
+            (entries[:, 0] == shard).all()
+            and (entries[:, 2] == height).all()
+            and (entries[:, 3] == width).all()
+            and (np.diff(entries[:, 1]) == frame_size).all()
+        ):
+            return shards[shard][offset:end].reshape(len(entries), height, width, 3)
+
+        return [
+            shards[shard][offset : offset + height * width * 3].reshape(  # noqa E203
+                height, width, 3
+            )
+            for shard, offset, height, width in entries
+        ]
+
+    def _load_window(self, start: int, stop: int) -> list:
+        frames = list(self.get_frames(start, stop))
+        if self.face_scale is not None:
+            frames = [
+                self._sub_crop(sample_index, frame)
+                for sample_index, frame in zip(range(start, stop), frames)
+            ]
+        return frames
+
+    def _load_frame(self, sample_index: int):
+        return self._load_window(sample_index, sample_index + 1)[0]
@@ -0,0 +1,212 @@
+"""Samplers for FileListDataset that take the videos of the samples into account."""
+import numpy as np
+import torch.distributed as dist
+from torch.utils.data import Sampler
+
+from faceforensics_internal.file_list_dataset import FileListDataset
+
+
+def _group_by_video(video_ids: np.ndarray):
+    """Returns the sample indices sorted by video (keeping their order inside a video),
+    the group of each of them and the position inside its group."""
+    order = np.argsort(video_ids, kind="stable")
+    sorted_ids = video_ids[order]
+    is_start = np.ones(len(order), dtype=bool)
+    is_start[1:] = sorted_ids[1:] != sorted_ids[:-1]
+    starts = np.flatnonzero(is_start)
+    group = np.cumsum(is_start) - 1
+    position = np.arange(len(order)) - starts[group]
+    return order, group, position
+
+
+def _block_shuffle(
+    video_ids: np.ndarray,
+    block_size: int,
+    rng: np.random.RandomState,
+    shuffle_within_blocks: bool = False,
+    jitter: bool = True,
+) -> np.ndarray:
+    """Returns a permutation of range(len(video_ids)) that keeps blocks of block_size
+    consecutive samples of a video together (see BlockShuffleSampler)."""
+    if len(video_ids) == 0:
+        return np.array([], dtype=np.int64)
+    order, group, position = _group_by_video(video_ids)
+
+    if jitter:
+        offsets = rng.randint(block_size, size=group[-1] + 1)
+    else:
+        offsets = np.zeros(group[-1] + 1, dtype=np.int64)
+    block_in_group = (position + offsets[group]) // block_size
+
+    is_block_start = np.ones(len(order), dtype=bool)
+    is_block_start[1:] = (group[1:] != group[:-1]) | (
+        block_in_group[1:] != block_in_group[:-1]
+    )
+    block = np.cumsum(is_block_start) - 1
+    block_rank = rng.permutation(block[-1] + 1)
+
+    if shuffle_within_blocks:
+        within_block = rng.random_sample(len(order))
+    else:
+        within_block = position
+    return order[np.lexsort((within_block, block_rank[block]))]
+
+
+class BlockShuffleSampler(Sampler):
+    """Shuffles blocks of consecutive samples of the same video instead of single
+    samples.
+
+    The samples of each video are split into blocks of block_size consecutive samples.
+    Each epoch the order of all blocks is shuffled, the samples inside a block are read
+    one after the other. So consecutive reads hit the same video folder, which helps
+    readahead and the page cache on slow storage.
+
+    Statistical equivalence: every epoch is a permutation of all samples, i.e. each
+    sample is drawn exactly once per epoch just like with RandomSampler, and every
+    block is equally likely to be at any position. With jitter=True the block borders
+    are moved by a random offset per video and epoch, so which samples share a block
+    changes from epoch to epoch and every pair of neighbouring samples of a video ends
+    up in different blocks in some epochs. With shuffle_within_blocks=True the order
+    inside a block is shuffled as well. With block_size=1 the sampler draws the same
+    distribution of permutations as RandomSampler. The remaining difference is that a
+    batch holds about batch_size / block_size videos instead of up to batch_size,
+    which increases the correlation inside a batch; keep block_size well below
+    batch_size if this matters.
+
+    Args:
+        dataset: dataset to sample from
+        block_size: number of consecutive samples of a video that are read together
+        shuffle_within_blocks: shuffle the order of the samples inside a block
+        jitter: move the block borders by a random offset per video and epoch
+        seed: seed of the random number generator. Every epoch uses seed and epoch.
+
+    """
+
+    def __init__(
+        self,
+        dataset: FileListDataset,
+        block_size: int = 16,
+        shuffle_within_blocks: bool = False,
+        jitter: bool = True,
+        seed: int = 0,
+    ):
+        self.video_ids = dataset.get_video_ids()
+        self.block_size = block_size
+        self.shuffle_within_blocks = shuffle_within_blocks
+        self.jitter = jitter
+        self.seed = seed
+        self.epoch = 0
+
+    def set_epoch(self, epoch: int):
+        self.epoch = epoch
+
+    def __iter__(self):
+        rng = np.random.RandomState([self.seed, self.epoch])
+        self.epoch += 1
+        permutation = _block_shuffle(
+            self.video_ids,
+            self.block_size,
+            rng,
+            shuffle_within_blocks=self.shuffle_within_blocks,
+            jitter=self.jitter,
+        )
+        return iter(permutation.tolist())
+
+    def __len__(self):
+        return len(self.video_ids)
+
+
+class VideoDistributedSampler(Sampler):
+    """DistributedSampler that assigns whole videos to the ranks.
+
+    Every video (and with it every window of sequence_length frames ending in one of
+    its samples) belongs to exactly one rank, so each rank and with it each node only
+    reads about 1/num_replicas of the data and its page cache only has to hold this
+    part. The assignment is deterministic and the same in every epoch: videos are
+    sorted by their number of samples and each one is given to the rank with the
+    fewest samples so far.
+
+    Like DistributedSampler all ranks return the same number of samples. Smaller
+    shards are padded with their own samples or, if drop_last, larger shards are
+    truncated. Inside a shard the samples are shuffled every epoch in blocks of
+    block_size consecutive samples of a video (see BlockShuffleSampler), block_size=1
+    shuffles single samples.
+
+    Every rank needs at least one video, so num_replicas can't be larger than the
+    number of videos of the dataset.
+
+    Args:
+        dataset: dataset to sample from
+        num_replicas: number of processes, defaults to the world size
+        rank: rank of the current process, defaults to the current rank
+        shuffle: shuffle the samples of the shard every epoch
+        block_size: number of consecutive samples of a video that are read together
+        seed: seed of the random number generator. Every epoch uses seed and epoch.
+        drop_last: truncate the shards to the smallest one instead of padding
+
+    """
+
+    def __init__(
+        self,
+        dataset: FileListDataset,
+        num_replicas: int = None,
+        rank: int = None,
+        shuffle: bool = True,
+        block_size: int = 1,
+        seed: int = 0,
+        drop_last: bool = False,
+    ):
+        if num_replicas is None:
+            num_replicas = dist.get_world_size()
+        if rank is None:
+            rank = dist.get_rank()
+        self.num_replicas = num_replicas
+        self.rank = rank
+        self.shuffle = shuffle
+        self.block_size = block_size
+        self.seed = seed
+        self.epoch = 0
+
+        self.video_ids = dataset.get_video_ids()
+        nb_videos = len(np.unique(self.video_ids))
+        if num_replicas > nb_videos:
+            raise ValueError(
+                f"{nb_videos} videos can't be distributed to {num_replicas} replicas, "
+                f"every replica needs at least one video."
+            )
+        shards = self._assign_videos(self.video_ids, num_replicas)
+        self.indices = shards[rank]
+        shard_sizes = [len(shard) for shard in shards]
+        self.num_samples = min(shard_sizes) if drop_last else max(shard_sizes)
+
+    @staticmethod
+    def _assign_videos(video_ids: np.ndarray, num_replicas: int):
+        """Returns the sample indices of each rank."""
+        videos, counts = np.unique(video_ids, return_counts=True)
+        # largest videos first, ties broken by video id -> same result on every rank
+        loads = [0] * num_replicas
+        rank_of_video = {}
+        for idx in np.lexsort((videos, -counts)):
+            rank = int(np.argmin(loads))
+            rank_of_video[videos[idx]] = rank
+            loads[rank] += counts[idx]
+
+        ranks = np.array([rank_of_video[video] for video in videos])
+        sample_ranks = ranks[np.searchsorted(videos, video_ids)]
+        return [np.flatnonzero(sample_ranks == rank) for rank in range(num_replicas)]
+
+    def set_epoch(self, epoch: int):
+        self.epoch = epoch
+
+    def __iter__(self):
+        indices = self.indices
+        if self.shuffle:
+            rng = np.random.RandomState([self.seed, self.epoch, self.rank])
+            indices = indices[
+                _block_shuffle(self.video_ids[indices], self.block_size, rng)
+            ]
+        self.epoch += 1
+        return iter(np.resize(indices, self.num_samples).tolist())
+
+    def __len__(self):
+        return self.num_samples
@@ -11,6 +11,7 @@ from joblib import Parallel
 from joblib._multiprocessing_helpers import mp
 from tqdm import tqdm
 
+from faceforensics_internal.catalog import Catalog
 from faceforensics_internal.utils import Compression
 from faceforensics_internal.utils import DataType
 from faceforensics_internal.utils import FaceForensicsDataStructure
@@ -301,6 +302,11 @@ def aggregate_masks_and_face_locations(
         data_types=(DataType.bounding_boxes,),
     )
 
+    catalog = Catalog(source_dir_root)
+    catalog.prefetch(
+        face_information_data_structure.get_subdirs()
+        + mask_data_structure.get_subdirs()
+    )
     for face_information, bounding_boxes, mask_data in zip(
         face_information_data_structure.get_subdirs(),
         bounding_boxs_data_structure.get_subdirs(),
@@ -325,7 +331,7 @@ def aggregate_masks_and_face_locations(
                         _face_information_video, None, bounding_boxes
                     )
                 )(face_information_video)
-                for face_information_video in tqdm(sorted(face_information.iterdir()))
+                for face_information_video in tqdm(catalog.videos(face_information))
             )
 
         else:
@@ -337,10 +343,12 @@ def aggregate_masks_and_face_locations(
                     )
                 )(face_information_video, mask_data_video)
                 for face_information_video, mask_data_video in tqdm(
-                    zip(sorted(face_information.iterdir()), sorted(mask_data.iterdir()))
+                    zip(catalog.videos(face_information), catalog.videos(mask_data))
                 )
             )
 
+    catalog.save()
+
 
 if __name__ == "__main__":
     aggregate_masks_and_face_locations()
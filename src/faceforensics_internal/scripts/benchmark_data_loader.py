@@ -0,0 +1,267 @@
+"""Find num_workers, batch_size and prefetch_factor for loading a FileListDataset.
+
+First the time per sample spent in each stage of loading is measured in this process:
+open (reading the files), decode (decoding them again, now from the page cache),
+transform and collate. Then the samples/s of a DataLoader are measured for every
+combination of the given parameters, not counting the first warmup_batches (which
+include starting the workers). The recommended configuration is the one with the
+fewest workers and the smallest prefetch_factor whose samples/s are within tolerance of
+the fastest one. With --output everything is written to a json file, e.g. to be read by
+a training launcher.
+
+prefetch_factor can only be set with torch>=1.7, older versions always prefetch 2
+batches per worker.
+"""
+import inspect
+import itertools
+import json
+import logging
+import time
+
+from typing import Optional
+
+import click
+import numpy as np
+import torch
+from torch.utils.data import DataLoader
+from torch.utils.data import RandomSampler
+from torch.utils.data.dataloader import default_collate
+from torchvision import transforms
+
+from faceforensics_internal.decoders import DECODERS
+from faceforensics_internal.decoders import PIL_DECODER
+from faceforensics_internal.file_list_dataset import FileList
+from faceforensics_internal.splits import TRAIN_NAME
+
+logger = logging.getLogger(__file__)
+
+# batches loaded in advance by each worker if prefetch_factor can't be set
+DEFAULT_PREFETCH_FACTOR = 2
+
+
+def _accepts(function, argument: str) -> bool:
+    """Whether the installed version of function (or class) has argument."""
+    return argument in inspect.signature(function).parameters
+
+
+def _stage_times(dataset, num_samples: int, batch_size: int, seed: int) -> dict:
+    """Returns the mean seconds per sample spent in each stage of loading."""
+    rng = np.random.RandomState(seed)
+    indices = rng.choice(len(dataset), min(num_samples, len(dataset)), False)
+    times = {"open": 0.0, "decode": 0.0, "transform": 0.0, "collate": 0.0}
+
+    samples = []
+    for index in indices:
+        start, stop = dataset._window(int(index))
+        paths = [
+            f"{dataset.root}/{dataset._samples.path(sample_index)}"
+            for sample_index in range(start, stop)
+        ]
+
+        start_time = time.time()
+        for path in paths:
+            with open(path, "rb") as f:
+                f.read()
+        times["open"] += time.time() - start_time
+
+        start_time = time.time()
+        images = [dataset.loader(path) for path in paths]
+        times["decode"] += time.time() - start_time
+
+        start_time = time.time()
+        samples.append(dataset._to_sample(images, dataset._samples.label(start)))
+        times["transform"] += time.time() - start_time
+
+    for batch_start in range(0, len(samples), batch_size):
+        start_time = time.time()
+        default_collate(samples[batch_start : batch_start + batch_size])  # noqa E203
+        times["collate"] += time.time() - start_time
+
+    return {stage: duration / len(indices) for stage, duration in times.items()}
+
+
+def _samples_per_second(
+    dataset,
+    num_workers: int,
+    batch_size: int,
+    prefetch_factor: int,
+    max_batches: int,
+    warmup_batches: int,
+    seed: int,
+) -> Optional[float]:
+    """Returns the samples/s after the warmup batches, None if there were no batches
+    left to time."""
+    kwargs = {}
+    if num_workers > 0 and _accepts(DataLoader, "prefetch_factor"):
+        kwargs["prefetch_factor"] = prefetch_factor
+    if _accepts(RandomSampler, "generator"):
+        sampler = RandomSampler(dataset, generator=torch.Generator().manual_seed(seed))
+    else:
+        # torch<1.6 samples with the global generator
+        torch.manual_seed(seed)
+        sampler = RandomSampler(dataset)
+    data_loader = DataLoader(
+        dataset,
+        batch_size=batch_size,
+        sampler=sampler,
+        num_workers=num_workers,
+        **kwargs,
+    )
+    if len(data_loader) < warmup_batches + max_batches:
+        logger.warning(
+            f"The split only has {len(data_loader)} batches of {batch_size}, fewer "
+            f"than {warmup_batches} warmup and {max_batches} timed batches."
+        )
+    nb_samples = 0
+    start_time = time.time()
+    for batch_idx, (samples, _) in enumerate(data_loader):
+        if batch_idx < warmup_batches:
+            # the timer starts after the last warmup batch was received
+            start_time = time.time()
+            continue
+        nb_samples += len(samples)
+        if batch_idx + 1 >= warmup_batches + max_batches:
+            break
+    if nb_samples == 0:
+        return None
+    return nb_samples / (time.time() - start_time)
+
+
+def _recommend(results: list, tolerance: float) -> dict:
+    best = max(result["samples_per_second"] for result in results)
+    good_enough = [
+        result
+        for result in results
+        if result["samples_per_second"] >= (1 - tolerance) * best
+    ]
+    return min(
+        good_enough,
+        key=lambda result: (
+            result["num_workers"],
+            result["prefetch_factor"],
+            -result["samples_per_second"],
+        ),
+    )
+
+
+@click.command()
+@click.option("--file_list", required=True, type=click.Path(exists=True))
+@click.option("--split", default=TRAIN_NAME)
+@click.option("--sequence_length", default=1)
+@click.option(
+    "--num_workers", "-w", multiple=True, type=click.INT, default=[0, 2, 4, 8]
+)
+@click.option("--batch_sizes", "-b", multiple=True, type=click.INT, default=[32, 64])
+@click.option("--prefetch_factors", "-p", multiple=True, type=click.INT, default=[2, 4])
+@click.option("--max_batches", default=50)
+@click.option("--warmup_batches", default=5)
+@click.option("--profile_samples", default=200)
+@click.option("--size", default=112, help="Images are resized to size x size.")
+@click.option("--decoder", type=click.Choice(list(DECODERS)), default=PIL_DECODER)
+@click.option(
+    "--tolerance",
+    default=0.05,
+    help="Fraction of the best samples/s a cheaper configuration may be slower.",
+)
+@click.option("--seed", default=0)
+@click.option("--output", default=None, type=click.Path(), help="Result as json.")
+def benchmark_data_loader(
+    file_list,
+    split,
+    sequence_length,
+    num_workers,
+    batch_sizes,
+    prefetch_factors,
+    max_batches,
+    warmup_batches,
+    profile_samples,
+    size,
+    decoder,
+    tolerance,
+    seed,
+    output,
+):
+    dataset = FileList.load(file_list).get_dataset(
+        split,
+        [transforms.Resize((size, size))],
+        sequence_length=sequence_length,
+        decoder=decoder,
+    )
+
+    stages = _stage_times(dataset, profile_samples, max(batch_sizes), seed)
+    logger.info(
+        "Time per sample: "
+        + ", ".join(
+            f"{stage} {duration * 1000:.2f}ms" for stage, duration in stages.items()
+        )
+    )
+
+    if not _accepts(DataLoader, "prefetch_factor"):
+        logger.warning(
+            f"prefetch_factor needs torch>=1.7, only the default of "
+            f"{DEFAULT_PREFETCH_FACTOR} is measured."
+        )
+        prefetch_factors = [DEFAULT_PREFETCH_FACTOR]
+
+    results = []
+    for workers, batch_size, prefetch_factor in itertools.product(
+        num_workers, batch_sizes, prefetch_factors
+    ):
+        if workers == 0 and prefetch_factor != prefetch_factors[0]:
+            # prefetch_factor has no effect without workers
+            continue
+        samples_per_second = _samples_per_second(
+            dataset,
+            workers,
+            batch_size,
+            prefetch_factor,
+            max_batches,
+            warmup_batches,
+            seed,
+        )
+        if samples_per_second is None:
+            logger.warning(
+                f"num_workers={workers}, batch_size={batch_size}, "
+                f"prefetch_factor={prefetch_factor}: no batches after the warmup."
+            )
+            continue
+        results.append(
+            {
+                "num_workers": workers,
+                "batch_size": batch_size,
+                "prefetch_factor": prefetch_factor,
+                "samples_per_second": samples_per_second,
+            }
+        )
+        logger.info(
+            f"num_workers={workers}, batch_size={batch_size}, "
+            f"prefetch_factor={prefetch_factor}: {samples_per_second:.1f} samples/s"
+        )
+
+    if not results:
+        raise click.UsageError(
+            "No configuration was timed, use fewer --warmup_batches or smaller "
+            "--batch_sizes."
+        )
+    recommended = _recommend(results, tolerance)
+    logger.info(f"Recommended: {recommended}")
+
+    if output:
+        with open(output, "w") as f:
+            json.dump(
+                {
+                    "file_list": str(file_list),
+                    "split": split,
+                    "sequence_length": sequence_length,
+                    "decoder": decoder,
+                    "stage_seconds_per_sample": stages,
+                    "results": results,
+                    "recommended": recommended,
+                },
+                f,
+                indent=4,
+            )
+
+
+if __name__ == "__main__":
+    benchmark_data_loader()
@@ -0,0 +1,79 @@
+"""Compare the image decoders of faceforensics_internal.decoders.
+
+Every decoder decodes the same random sample of frames of a split and converts them to
+uint8 tensors with ToUint8Tensor. Reported are frames/s and the bytes allocated per
+frame for the decoded frame and for the copy needed to get a tensor.
+"""
+import logging
+import time
+
+import click
+import numpy as np
+import torch
+
+from faceforensics_internal.batch_transforms import ToUint8Tensor
+from faceforensics_internal.decoders import DECODERS
+from faceforensics_internal.decoders import get_decoder
+from faceforensics_internal.file_list_dataset import FileList
+from faceforensics_internal.frame_cache import frame_nbytes
+from faceforensics_internal.splits import TRAIN_NAME
+
+logger = logging.getLogger(__file__)
+
+
+def _shares_memory(image, tensor: torch.Tensor) -> bool:
+    if isinstance(image, torch.Tensor):
+        return image.data_ptr() == tensor.data_ptr()
+    if isinstance(image, np.ndarray):
+        return np.shares_memory(image, tensor.numpy())
+    return False
+
+
+def _benchmark_decoder(decoder: str, paths):
+    loader = get_decoder(decoder)
+    to_tensor = ToUint8Tensor()
+    nb_bytes = 0
+    start_time = time.time()
+    for path in paths:
+        image = loader(path)
+        tensor = to_tensor(image)
+        nb_bytes += frame_nbytes(image)
+        if not _shares_memory(image, tensor):
+            nb_bytes += tensor.nelement()
+    duration = time.time() - start_time
+    return len(paths) / duration, nb_bytes / len(paths)
+
+
+@click.command()
+@click.option("--file_list", required=True, type=click.Path(exists=True))
+@click.option("--split", default=TRAIN_NAME)
+@click.option(
+    "--decoders", "-d", multiple=True, type=click.Choice(list(DECODERS)), default=None
+)
+@click.option("--num_frames", default=1000)
+@click.option("--seed", default=0)
+def benchmark_decoders(file_list, split, decoders, num_frames, seed):
+    file_list = FileList.load(file_list)
+    samples = file_list.samples[split]
+    rng = np.random.RandomState(seed)
+    sample_indices = rng.choice(len(samples), min(num_frames, len(samples)), False)
+    paths = [f"{file_list.root}/{samples.path(int(idx))}" for idx in sample_indices]
+
+    for decoder in decoders or DECODERS:
+        # decode one frame first, so that the imports and setup are not measured
+        try:
+            get_decoder(decoder)(paths[0])
+        except ImportError as e:
+            if decoders:
+                raise
+            logger.warning(f"Skipping {decoder}: {e}")
+            continue
+        frames_per_second, bytes_per_frame = _benchmark_decoder(decoder, paths)
+        logger.info(
+            f"{decoder}: {frames_per_second:.1f} frames/s, "
+            f"{bytes_per_frame / 2 ** 10:.1f} KiB allocated per frame"
+        )
+
+
+if __name__ == "__main__":
+    benchmark_decoders()
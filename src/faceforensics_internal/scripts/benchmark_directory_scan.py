@@ -0,0 +1,119 @@
+"""Measure how scanning a large tree of frames scales with the number of threads.
+
+A synthetic tree of methods x videos x frames empty png files is created in root (if it
+does not exist yet), laid out like face_images_tracked folders of FaceForensics. Then
+the tree is scanned serially with iterdir and glob (like create_file_list did before
+the catalog) and with a Catalog for every number of workers, each time without a
+cached listing. Finally the time of revalidating a saved catalog is reported.
+"""
+import logging
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import click
+from tqdm import tqdm
+
+from faceforensics_internal.catalog import Catalog
+from faceforensics_internal.file_list_dataset import FRAME_NAME
+
+logger = logging.getLogger(__file__)
+
+
+def _subdirs(root: Path, methods: int):
+    return [
+        root / f"method_{method}" / "c40" / "face_images_tracked"
+        for method in range(methods)
+    ]
+
+
+def _create_video(video_folder: Path, frames: int):
+    video_folder.mkdir(parents=True, exist_ok=True)
+    for frame in range(frames):
+        open(video_folder / FRAME_NAME.format(frame), "wb").close()
+
+
+def _create_tree(root: Path, methods: int, videos: int, frames: int):
+    video_folders = [
+        subdir / f"{video:03d}"
+        for subdir in _subdirs(root, methods)
+        for video in range(videos)
+    ]
+    logger.info(f"Creating {len(video_folders) * frames} files in {root}.")
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        list(
+            tqdm(
+                executor.map(
+                    lambda folder: _create_video(folder, frames), video_folders
+                ),
+                total=len(video_folders),
+            )
+        )
+
+
+def _scan_glob(subdirs) -> int:
+    nb_frames = 0
+    for subdir in subdirs:
+        for video_folder in sorted(subdir.iterdir()):
+            nb_frames += len(sorted(video_folder.glob("*.png")))
+    return nb_frames
+
+
+def _scan_catalog(root: Path, subdirs, workers: int, index_file: Path) -> int:
+    catalog = Catalog(root, index_file, max_workers=workers)
+    catalog.prefetch(subdirs)
+    return sum(
+        len(catalog.frames(video_folder))
+        for subdir in subdirs
+        for video_folder in catalog.videos(subdir)
+    )
+
+
+@click.command()
+@click.option("--root", required=True, type=click.Path())
+@click.option("--methods", default=5)
+@click.option("--videos", default=1000, help="Videos per method.")
+@click.option("--frames", default=200, help="Frames per video.")
+@click.option(
+    "--workers", "-w", multiple=True, type=click.INT, default=[1, 2, 4, 8, 16, 32]
+)
+def benchmark_directory_scan(root, methods, videos, frames, workers):
+    root = Path(root)
+    if not root.exists():
+        _create_tree(root, methods, videos, frames)
+    subdirs = _subdirs(root, methods)
+
+    start_time = time.time()
+    nb_frames = _scan_glob(subdirs)
+    logger.info(
+        f"iterdir + glob: {nb_frames} frames in {time.time() - start_time:.2f}s"
+    )
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        index_file = Path(tmp_dir) / "catalog.npz"
+        serial_duration = None
+        for nb_workers in workers:
+            start_time = time.time()
+            nb_frames = _scan_catalog(root, subdirs, nb_workers, index_file)
+            duration = time.time() - start_time
+            serial_duration = serial_duration or duration
+            logger.info(
+                f"Catalog with {nb_workers} workers: {nb_frames} frames in "
+                f"{duration:.2f}s (speedup {serial_duration / duration:.1f}x)"
+            )
+
+        catalog = Catalog(root, index_file, max_workers=max(workers))
+        catalog.prefetch(subdirs)
+        catalog.save()
+        start_time = time.time()
+        _scan_catalog(root, subdirs, max(workers), index_file)
+        logger.info(
+            f"Revalidating the saved catalog: {time.time() - start_time:.2f}s "
+            f"({os.path.getsize(index_file) / 1e6:.1f}MB index)"
+        )
+
+
+if __name__ == "__main__":
+    benchmark_directory_scan()
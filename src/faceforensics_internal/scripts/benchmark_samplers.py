@@ -0,0 +1,141 @@
+"""Compare the loading throughput of BlockShuffleSampler and RandomSampler.
+
+The videos of the split are divided into disjoint groups, one for every run of every
+sampler, so no run reads frames that an earlier run brought into the page cache. Each
+sampler is run repeats times, in a random order of the samplers per repetition, and
+the first warmup_batches of each run (which include starting the workers) are not
+timed.
+
+Run it with a cold page cache (e.g. after `sync; echo 3 > /proc/sys/vm/drop_caches`)
+and on the storage the training reads from, otherwise all samplers read from memory.
+"""
+import logging
+import time
+
+import click
+import numpy as np
+from torch.utils.data import DataLoader
+from torch.utils.data import RandomSampler
+from torch.utils.data import Subset
+from torchvision import transforms
+
+from faceforensics_internal.file_list_dataset import FileList
+from faceforensics_internal.samplers import BlockShuffleSampler
+from faceforensics_internal.splits import TRAIN_NAME
+
+logger = logging.getLogger(__file__)
+
+
+class _VideoSubset(Subset):
+    """Subset that still provides the video ids needed by BlockShuffleSampler."""
+
+    def get_video_ids(self) -> np.ndarray:
+        return self.dataset.get_video_ids()[self.indices]
+
+
+def _video_subsets(dataset, nb_subsets: int, rng: np.random.RandomState) -> list:
+    """Splits the samples of dataset into nb_subsets subsets of disjoint videos."""
+    video_ids = dataset.get_video_ids()
+    videos = rng.permutation(np.unique(video_ids))
+    if len(videos) < nb_subsets:
+        raise ValueError(
+            f"{len(videos)} videos can't be split into {nb_subsets} runs, use fewer "
+            f"repeats or block sizes."
+        )
+    return [
+        _VideoSubset(dataset, np.flatnonzero(np.isin(video_ids, subset_videos)))
+        for subset_videos in np.array_split(videos, nb_subsets)
+    ]
+
+
+def _samples_per_second(
+    dataset, sampler, batch_size, num_workers, max_samples, warmup_batches
+):
+    data_loader = DataLoader(
+        dataset, batch_size=batch_size, sampler=sampler, num_workers=num_workers
+    )
+    nb_samples = 0
+    start_time = time.time()
+    for batch_idx, (samples, _) in enumerate(data_loader):
+        if batch_idx < warmup_batches:
+            # the timer starts after the last warmup batch was received
+            start_time = time.time()
+            continue
+        nb_samples += len(samples)
+        if nb_samples >= max_samples:
+            break
+    if nb_samples == 0:
+        return float("nan")
+    return nb_samples / (time.time() - start_time)
+
+
+@click.command()
+@click.option("--file_list", required=True, type=click.Path(exists=True))
+@click.option("--split", default=TRAIN_NAME)
+@click.option("--sequence_length", default=1)
+@click.option("--block_sizes", "-b", multiple=True, type=click.INT, default=[4, 16, 64])
+@click.option("--batch_size", default=64)
+@click.option("--num_workers", default=4)
+@click.option("--max_samples", default=10000, help="Timed samples per run.")
+@click.option("--warmup_batches", default=5)
+@click.option("--repeats", default=3, help="Runs of every sampler.")
+@click.option("--size", default=112, help="Images are resized to size x size.")
+@click.option("--seed", default=0)
+def benchmark_samplers(
+    file_list,
+    split,
+    sequence_length,
+    block_sizes,
+    batch_size,
+    num_workers,
+    max_samples,
+    warmup_batches,
+    repeats,
+    size,
+    seed,
+):
+    dataset = FileList.load(file_list).get_dataset(
+        split, [transforms.Resize((size, size))], sequence_length=sequence_length
+    )
+    samplers = [("RandomSampler", lambda subset: RandomSampler(subset))] + [
+        (
+            f"BlockShuffleSampler(block_size={block_size})",
+            lambda subset, block_size=block_size: BlockShuffleSampler(
+                subset, block_size=block_size, seed=seed
+            ),
+        )
+        for block_size in block_sizes
+    ]
+
+    rng = np.random.RandomState(seed)
+    subsets = iter(_video_subsets(dataset, len(samplers) * repeats, rng))
+    results = {name: [] for name, _ in samplers}
+    for repeat in range(repeats):
+        for sampler_idx in rng.permutation(len(samplers)):
+            name, create_sampler = samplers[sampler_idx]
+            subset = next(subsets)
+            if len(subset) < (warmup_batches + 1) * batch_size:
+                logger.warning(
+                    f"{name}: only {len(subset)} samples in the videos of this run, "
+                    f"fewer than {warmup_batches} warmup batches and one timed batch."
+                )
+            samples_per_second = _samples_per_second(
+                subset,
+                create_sampler(subset),
+                batch_size,
+                num_workers,
+                max_samples,
+                warmup_batches,
+            )
+            results[name].append(samples_per_second)
+            logger.info(f"{name} (run {repeat}): {samples_per_second:.1f} samples/s")
+
+    for name, runs in results.items():
+        logger.info(
+            f"{name}: {np.nanmean(runs):.1f} samples/s "
+            f"(min {np.nanmin(runs):.1f}, max {np.nanmax(runs):.1f})"
+        )
+
+
+if __name__ == "__main__":
+    benchmark_samplers()
@@ -0,0 +1,55 @@
+import logging
+
+import click
+
+from faceforensics_internal.dataset_statistics import compute_statistics
+from faceforensics_internal.decoders import DECODERS
+from faceforensics_internal.decoders import PIL_DECODER
+from faceforensics_internal.file_list_dataset import FileList
+from faceforensics_internal.splits import TRAIN_NAME
+
+logger = logging.getLogger(__file__)
+
+
+@click.command()
+@click.option("--file_list", required=True, type=click.Path(exists=True))
+@click.option("--output", required=True, type=click.Path())
+@click.option("--split", default=TRAIN_NAME)
+@click.option("--num_workers", default=8)
+@click.option("--chunk_size", default=256)
+@click.option(
+    "--max_frames",
+    default=None,
+    type=click.INT,
+    help="Only use a random subset of this many frames.",
+)
+@click.option("--histograms", is_flag=True)
+@click.option("--decoder", type=click.Choice(list(DECODERS)), default=PIL_DECODER)
+@click.option("--seed", default=0)
+def compute(
+    file_list,
+    output,
+    split,
+    num_workers,
+    chunk_size,
+    max_frames,
+    histograms,
+    decoder,
+    seed,
+):
+    statistics = compute_statistics(
+        FileList.load(file_list),
+        split,
+        num_workers=num_workers,
+        chunk_size=chunk_size,
+        max_frames=max_frames,
+        histograms=histograms,
+        decoder=decoder,
+        seed=seed,
+    )
+    logger.info(f"mean: {statistics.mean.tolist()}, std: {statistics.std.tolist()}")
+    statistics.save(output)
+
+
+if __name__ == "__main__":
+    compute()
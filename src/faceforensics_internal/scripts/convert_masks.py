@@ -0,0 +1,97 @@
+"""Convert mask videos to run-length encoded mask files (see mask_store)."""
+import logging
+import multiprocessing as mp
+from pathlib import Path
+
+import click
+import cv2
+from joblib import delayed
+from joblib import Parallel
+from tqdm import tqdm
+
+from faceforensics_internal.catalog import Catalog
+from faceforensics_internal.mask_store import MASK_SUFFIX
+from faceforensics_internal.mask_store import write_masks
+from faceforensics_internal.utils import Compression
+from faceforensics_internal.utils import DataType
+from faceforensics_internal.utils import FaceForensicsDataStructure
+
+logger = logging.getLogger(__file__)
+
+
+def _read_masks(video_path: Path, threshold: int):
+    mask_capture = cv2.VideoCapture(str(video_path))
+    while mask_capture.isOpened():
+        ret, mask = mask_capture.read()
+        if not ret:
+            break
+        yield mask.max(axis=2) > threshold
+    mask_capture.release()
+
+
+def convert_masks_of_video(video_path: Path, target_sub_dir: Path, threshold: int):
+    output_path = (target_sub_dir / video_path.name).with_suffix(MASK_SUFFIX)
+    if output_path.exists():
+        return
+
+    # write to a temporary file first, so that interrupted runs don't leave broken files
+    tmp_path = output_path.with_suffix(".tmp")
+    write_masks(tmp_path, _read_masks(video_path, threshold))
+    tmp_path.rename(output_path)
+
+
+@click.command()
+@click.option("--source_dir_root", required=True, type=click.Path(exists=True))
+@click.option(
+    "--methods",
+    "-m",
+    multiple=True,
+    default=FaceForensicsDataStructure.MANIPULATED_METHODS,
+)
+@click.option(
+    "--threshold",
+    default=0,
+    help="Pixels whose maximal channel value is larger belong to the mask.",
+)
+@click.option("--cpu_count", required=False, type=click.INT, default=mp.cpu_count())
+def convert_masks(source_dir_root, methods, threshold, cpu_count):
+    source_dir_data_structure = FaceForensicsDataStructure(
+        source_dir_root,
+        methods=methods,
+        compressions=(Compression.masks,),
+        data_types=(DataType.videos,),
+    )
+    target_dir_data_structure = FaceForensicsDataStructure(
+        source_dir_root,
+        methods=methods,
+        compressions=(Compression.masks,),
+        data_types=(DataType.rle_masks,),
+    )
+
+    catalog = Catalog(source_dir_root)
+    catalog.prefetch(source_dir_data_structure.get_subdirs())
+    for source_sub_dir, target_sub_dir in zip(
+        source_dir_data_structure.get_subdirs(), target_dir_data_structure.get_subdirs()
+    ):
+        if not source_sub_dir.exists():
+            continue
+
+        target_sub_dir.mkdir(parents=True, exist_ok=True)
+        logger.info(
+            f"Processing {source_sub_dir.parts[-2]}, {source_sub_dir.parts[-3]}"
+        )
+
+        Parallel(n_jobs=cpu_count)(
+            delayed(
+                lambda _video_path: convert_masks_of_video(
+                    _video_path, target_sub_dir, threshold
+                )
+            )(video_path)
+            for video_path in tqdm(catalog.videos(source_sub_dir))
+        )
+
+    catalog.save()
+
+
+if __name__ == "__main__":
+    convert_masks()
@@ -5,49 +5,155 @@ from typing import List
 import click
 import numpy as np
 
+from faceforensics_internal.catalog import Catalog
+from faceforensics_internal.catalog import DEFAULT_SCAN_WORKERS
+from faceforensics_internal.file_list_dataset import BINARY_SUFFIX
 from faceforensics_internal.file_list_dataset import FileList
+from faceforensics_internal.file_list_dataset import LINK_MODES
 from faceforensics_internal.splits import TEST
 from faceforensics_internal.splits import TEST_NAME
 from faceforensics_internal.splits import TRAIN
 from faceforensics_internal.splits import TRAIN_NAME
 from faceforensics_internal.splits import VAL
 from faceforensics_internal.splits import VAL_NAME
-from faceforensics_internal.utils import _img_name_to_int
 from faceforensics_internal.utils import Compression
 from faceforensics_internal.utils import DataType
 from faceforensics_internal.utils import FaceForensicsDataStructure
+from faceforensics_internal.video_file_list_dataset import VideoCatalog
 
 logger = logging.getLogger(__file__)
 
 
-def _get_min_sequence_length(source_dir_data_structure):
+def _get_min_sequence_length(source_sub_dirs: List[Path], catalog: Catalog):
     min_length = -1
 
-    for source_sub_dir in source_dir_data_structure.get_subdirs():
-        for video_folder in sorted(source_sub_dir.iterdir()):
-            number_of_frames = len(list(video_folder.glob("*.png")))
+    for source_sub_dir in source_sub_dirs:
+        for video_folder in catalog.videos(source_sub_dir):
+            number_of_frames = len(catalog.frames(video_folder))
             if min_length == -1 or min_length > number_of_frames:
                 min_length = number_of_frames
 
     return min_length
 
 
-def _select_frames(nb_images: int, samples_per_video: int) -> List[int]:
-    """Selects frames to take from video.
+def _eligible_frames(
+    frames: np.ndarray, video_starts: np.ndarray, min_sequence_length: int
+) -> np.ndarray:
+    """Returns a mask of all frames that have at least min_sequence_length-1
+    preceeding consecutive frames. The first frame of a sequence is never eligible.
 
     Args:
-        nb_images: length of video aka. number of frames in video
-        samples_per_video: how many frames of this video should be taken. If this value
-            is bigger then nb_images or -1, nb_images are taken.
+        frames: concatenated sorted frame numbers of several videos
+        video_starts: mask of the frames that are the first frame of a video
+        min_sequence_length: see create_file_list
 
     """
-    if samples_per_video == -1 or samples_per_video > nb_images:
-        selected_frames = range(nb_images)
-    else:
-        selected_frames = np.rint(
-            np.linspace(1, nb_images, min(samples_per_video, nb_images)) - 1
-        ).astype(int)
-    return selected_frames
+    sequence_starts = video_starts.copy()
+    sequence_starts[1:] |= np.diff(frames) != 1
+    first_frame_idx = np.maximum.accumulate(
+        np.where(sequence_starts, np.arange(len(frames)), 0)
+    )
+    return ~sequence_starts & (
+        frames - frames[first_frame_idx] >= min_sequence_length - 1
+    )
+
+
+def _select_frames(nb_images: np.ndarray, samples_per_video: int) -> np.ndarray:
+    """Selects frames to take from several videos. Returns the indices of the selected
+    frames in the concatenated frames of all videos.
+
+    Args:
+        nb_images: length of each video aka. number of frames in video
+        samples_per_video: how many frames of each video should be taken. If this value
+            is bigger then the number of frames of a video or -1, all of its frames
+            are taken. Otherwise they are distributed uniformly.
+
+    """
+    nb_images = np.asarray(nb_images, dtype=np.int64)
+    take_all = (samples_per_video == -1) | (samples_per_video > nb_images)
+    nb_selected = np.where(take_all, nb_images, samples_per_video)
+
+    video = np.repeat(np.arange(len(nb_images)), nb_selected)
+    selected = np.arange(len(video)) - (np.cumsum(nb_selected) - nb_selected)[video]
+
+    # same as np.rint(np.linspace(1, n, k) - 1) for each video with n frames and k
+    # samples, which computes i * (n - 1) / (k - 1) + 1 and sets the last value to n
+    n, k = nb_images[video].astype(np.float64), nb_selected[video]
+    uniform = selected * ((n - 1) / np.maximum(k - 1, 1)) + 1
+    last = (selected == k - 1) & (k > 1)
+    uniform[last] = n[last]
+    selected = np.where(take_all[video], selected, np.rint(uniform - 1).astype(int))
+
+    return (np.cumsum(nb_images) - nb_images)[video] + selected
+
+
+def _add_sub_dirs(
+    file_list: FileList,
+    source_sub_dirs: List[Path],
+    samples_per_video_train,
+    samples_per_video_val,
+    catalog: Catalog,
+):
+    """Adds the samples of all videos in source_sub_dirs to file_list."""
+    min_sequence_length = file_list.min_sequence_length
+    catalog.prefetch(source_sub_dirs)
+    _min_sequence_length = _get_min_sequence_length(source_sub_dirs, catalog)
+    if (
+        _min_sequence_length < samples_per_video_train
+        or _min_sequence_length < samples_per_video_val
+    ):
+        logger.warning(
+            f"There is a sequence that has less frames "
+            f"then you would like to sample: {_min_sequence_length}"
+        )
+
+    for split, split_name in [(TRAIN, TRAIN_NAME), (VAL, VAL_NAME), (TEST, TEST_NAME)]:
+        for source_sub_dir in source_sub_dirs:
+            target = source_sub_dir.parts[-3]
+            video_folders, frames = [], []
+            for video_folder in catalog.videos(source_sub_dir):
+                video_frames = catalog.frames(video_folder)
+                if video_folder.name.split("_")[0] in split and len(video_frames) > 0:
+                    video_folders.append(video_folder)
+                    frames.append(video_frames)
+            if not video_folders:
+                continue
+
+            # find all frames that have at least min_sequence_length-1 preceeding
+            # frames, for all videos of this folder at once
+            nb_frames = np.array([len(video_frames) for video_frames in frames])
+            video_starts = np.zeros(nb_frames.sum(), dtype=bool)
+            video_starts[np.cumsum(nb_frames) - nb_frames] = True
+            filtered_images_idx = np.flatnonzero(
+                _eligible_frames(
+                    np.concatenate(frames), video_starts, min_sequence_length
+                )
+            )
+            nb_filtered = np.bincount(
+                np.repeat(np.arange(len(frames)), nb_frames)[filtered_images_idx],
+                minlength=len(frames),
+            )
+
+            # for the test-set all frames are going to be taken
+            # otherwise distribute uniformly
+
+            if split_name == TRAIN_NAME:
+                samples_per_video = samples_per_video_train
+            elif split_name == VAL_NAME:
+                samples_per_video = samples_per_video_val
+            elif split_name == TEST_NAME:
+                samples_per_video = -1
+
+            sampled_images_idx = filtered_images_idx[
+                _select_frames(nb_filtered, samples_per_video)
+            ]
+            file_list.add_videos(
+                video_folders=video_folders,
+                frames=frames,
+                target_label=target,
+                split=split_name,
+                sampled_images_idx=sampled_images_idx,
+            )
 
 
 def _create_file_list(
@@ -59,9 +165,16 @@ def _create_file_list(
     samples_per_video_train,
     samples_per_video_val,
     source_dir_root,
+    catalog: Catalog,
 ):
     file_list = FileList(
-        root=source_dir_root, classes=methods, min_sequence_length=min_sequence_length
+        root=source_dir_root,
+        classes=methods,
+        min_sequence_length=min_sequence_length,
+        samples_per_video={
+            TRAIN_NAME: samples_per_video_train,
+            VAL_NAME: samples_per_video_val,
+        },
     )
     # use faceforensicsdatastructure to iterate elegantly over the correct
     # image folders
@@ -71,64 +184,73 @@ def _create_file_list(
         compressions=compressions,
         data_types=data_types,
     )
+    _add_sub_dirs(
+        file_list,
+        source_dir_data_structure.get_subdirs(),
+        samples_per_video_train,
+        samples_per_video_val,
+        catalog,
+    )
 
-    _min_sequence_length = _get_min_sequence_length(source_dir_data_structure)
-    if (
-        _min_sequence_length < samples_per_video_train
-        or _min_sequence_length < samples_per_video_val
-    ):
-        logger.warning(
-            f"There is a sequence that has less frames "
-            f"then you would like to sample: {_min_sequence_length}"
+    file_list.save(output_file)
+    logger.info(f"{output_file} created.")
+    return file_list
+
+
+def _update_file_list(
+    file_list: FileList,
+    methods,
+    compressions,
+    data_types,
+    output_file,
+    samples_per_video_train,
+    samples_per_video_val,
+    source_dir_root,
+    catalog: Catalog,
+):
+    """Changes file_list to contain exactly the given methods, compressions and data
+    types. Only subdirectories that are not part of file_list yet are scanned, samples
+    of subdirectories that are not given anymore are removed."""
+    if Path(file_list.root).resolve() != Path(source_dir_root).resolve():
+        raise ValueError(
+            f"The file list to update is relative to {file_list.root}, "
+            f"not to {source_dir_root}."
         )
+    source_dir_data_structure = FaceForensicsDataStructure(
+        source_dir_root,
+        methods=methods,
+        compressions=compressions,
+        data_types=data_types,
+    )
+    source_sub_dirs = {
+        source_sub_dir.relative_to(source_dir_root).as_posix(): source_sub_dir
+        for source_sub_dir in source_dir_data_structure.get_subdirs()
+    }
+    existing_sub_dirs = file_list.get_subdirs()
 
-    for split, split_name in [(TRAIN, TRAIN_NAME), (VAL, VAL_NAME), (TEST, TEST_NAME)]:
-        for source_sub_dir in source_dir_data_structure.get_subdirs():
-            target = source_sub_dir.parts[-3]
-            for video_folder in sorted(source_sub_dir.iterdir()):
-                if video_folder.name.split("_")[0] in split:
-
-                    images = sorted(video_folder.glob("*.png"))
-                    filtered_images_idx = []
-
-                    # find all frames that have at least min_sequence_length-1 preceeding
-                    # frames
-                    if len(images) == 0:
-                        continue
-
-                    sequence_start = _img_name_to_int(images[0])
-                    last_idx = sequence_start
-                    for list_idx, image in enumerate(images):
-                        image_idx = _img_name_to_int(image)
-                        if last_idx + 1 != image_idx:
-                            sequence_start = image_idx
-                        elif image_idx - sequence_start >= min_sequence_length - 1:
-                            filtered_images_idx.append(list_idx)
-                        last_idx = image_idx
-
-                    # for the test-set all frames are going to be taken
-                    # otherwise distribute uniformly
-
-                    if split_name == TRAIN_NAME:
-                        samples_per_video = samples_per_video_train
-                    elif split_name == VAL_NAME:
-                        samples_per_video = samples_per_video_val
-                    elif split_name == TEST_NAME:
-                        samples_per_video = -1
-
-                    selected_frames = _select_frames(
-                        len(filtered_images_idx), samples_per_video
-                    )
-
-                    sampled_images_idx = np.asarray(filtered_images_idx)[
-                        selected_frames
-                    ]
-                    file_list.add_data_points(
-                        path_list=images,
-                        target_label=target,
-                        split=split_name,
-                        sampled_images_idx=sampled_images_idx,
-                    )
+    removed_sub_dirs = [
+        sub_dir for sub_dir in existing_sub_dirs if sub_dir not in source_sub_dirs
+    ]
+    if removed_sub_dirs:
+        logger.info(f"Removing {', '.join(removed_sub_dirs)}")
+        file_list.drop_subdirs(removed_sub_dirs)
+
+    new_sub_dirs = [
+        source_sub_dir
+        for sub_dir, source_sub_dir in source_sub_dirs.items()
+        if sub_dir not in existing_sub_dirs
+    ]
+    if new_sub_dirs:
+        logger.info(f"Adding {', '.join(map(str, new_sub_dirs))}")
+        for method in methods:
+            file_list.add_class(method)
+        _add_sub_dirs(
+            file_list,
+            new_sub_dirs,
+            samples_per_video_train,
+            samples_per_video_val,
+            catalog,
+        )
 
     file_list.save(output_file)
     logger.info(f"{output_file} created.")
@@ -152,12 +274,54 @@ def _create_file_list(
 )
 @click.option("--samples_per_video_train", default=100)
 @click.option("--samples_per_video_val", default=100)
+@click.option(
+    "--binary",
+    is_flag=True,
+    help="Save the filelist in the binary format that can be loaded lazily.",
+)
 @click.option(
     "--min_sequence_length",
     default=1,
     help="Indicates how many preceeded consecutive frames make a frame eligible (i.e."
     "if set to 5 frame 0004 is eligible if frames 0000-0003 are present as well.",
 )
+@click.option(
+    "--catalog_file",
+    default=None,
+    type=click.Path(),
+    help="Cached listing of source_dir_root. Defaults to source_dir_root/.catalog.npz",
+)
+@click.option(
+    "--scan_workers",
+    default=DEFAULT_SCAN_WORKERS,
+    help="Maximal number of directories that are scanned concurrently.",
+)
+@click.option(
+    "--update",
+    default=None,
+    type=click.Path(exists=True),
+    help="Existing filelist that is changed to the given methods, compressions and "
+    "data types instead of creating a new one. Only subdirectories it doesn't contain "
+    "yet are scanned, samples of the others are kept or removed.",
+)
+@click.option(
+    "--copy_threads",
+    default=16,
+    help="Number of files copied concurrently to target_dir_root.",
+)
+@click.option(
+    "--link",
+    type=click.Choice(LINK_MODES),
+    default=None,
+    help="Hard link or reflink files to target_dir_root instead of copying them, if "
+    "it is on the same file system as source_dir_root.",
+)
+@click.option(
+    "--from_videos",
+    is_flag=True,
+    help="Take the frames from the videos and their bounding boxes instead of the "
+    "extracted images, for loading with VideoFileListDataset.",
+)
 def create_file_list(
     source_dir_root,
     target_dir_root,
@@ -167,8 +331,20 @@ def create_file_list(
     data_types,
     samples_per_video_train,
     samples_per_video_val,
+    binary,
     min_sequence_length,
+    catalog_file,
+    scan_workers,
+    update,
+    copy_threads,
+    link,
+    from_videos,
 ):
+    if from_videos and target_dir_root:
+        raise click.BadParameter(
+            "The frames of a filelist created from videos can't be copied.",
+            param_hint="--target_dir_root",
+        )
 
     output_file = (
         "_".join([str(method) for method in methods])
@@ -182,7 +358,8 @@ def create_file_list(
         + str(samples_per_video_val)
         + "_"
         + str(min_sequence_length)
-        + ".json"
+        + ("_from_videos" if from_videos else "")
+        + (BINARY_SUFFIX if binary else ".json")
     )
     output_file = Path(output_dir) / output_file
 
@@ -191,23 +368,63 @@ def create_file_list(
         file_list = FileList.load(output_file)
         logger.warning("Reusing already created file!")
     except FileNotFoundError:
-        file_list = _create_file_list(
-            methods,
-            compressions,
-            data_types,
-            min_sequence_length,
-            output_file,
-            samples_per_video_train,
-            samples_per_video_val,
-            source_dir_root,
-        )
+        if from_videos:
+            catalog = VideoCatalog(source_dir_root, catalog_file, scan_workers)
+        else:
+            catalog = Catalog(source_dir_root, catalog_file, scan_workers)
+        if update:
+            file_list = FileList.load(update)
+            if file_list.min_sequence_length != min_sequence_length:
+                raise ValueError(
+                    f"{update} was created with min_sequence_length "
+                    f"{file_list.min_sequence_length}, not {min_sequence_length}."
+                )
+            samples_per_video = {
+                TRAIN_NAME: samples_per_video_train,
+                VAL_NAME: samples_per_video_val,
+            }
+            if file_list.samples_per_video is None:
+                logger.warning(
+                    f"{update} doesn't store its samples per video, make sure it was "
+                    f"created with {samples_per_video}."
+                )
+                file_list.samples_per_video = samples_per_video
+            elif file_list.samples_per_video != samples_per_video:
+                raise ValueError(
+                    f"{update} was created with samples per video "
+                    f"{file_list.samples_per_video}, not {samples_per_video}."
+                )
+            file_list = _update_file_list(
+                file_list,
+                methods,
+                compressions,
+                data_types,
+                output_file,
+                samples_per_video_train,
+                samples_per_video_val,
+                source_dir_root,
+                catalog,
+            )
+        else:
+            file_list = _create_file_list(
+                methods,
+                compressions,
+                data_types,
+                min_sequence_length,
+                output_file,
+                samples_per_video_train,
+                samples_per_video_val,
+                source_dir_root,
+                catalog,
+            )
+        catalog.save()
 
     if target_dir_root:
-        file_list.copy_to(Path(target_dir_root))
+        file_list.copy_to(Path(target_dir_root), copy_threads, link)
         file_list.save(output_file)
 
     for split in [TRAIN_NAME, VAL_NAME, TEST_NAME]:
-        data_set = FileList.get_dataset_form_file(output_file, split)
+        data_set = file_list.get_dataset(split)
         logger.info(f"{split}-data-set: {data_set}")
 
 
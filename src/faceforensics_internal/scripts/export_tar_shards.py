@@ -0,0 +1,42 @@
+import logging
+from pathlib import Path
+
+import click
+
+from faceforensics_internal.file_list_dataset import FileList
+from faceforensics_internal.splits import TEST_NAME
+from faceforensics_internal.splits import TRAIN_NAME
+from faceforensics_internal.splits import VAL_NAME
+from faceforensics_internal.tar_shards import export_tar_shards
+
+logger = logging.getLogger(__file__)
+
+
+@click.command()
+@click.option("--file_list", required=True, type=click.Path(exists=True))
+@click.option("--output_dir", required=True, type=click.Path())
+@click.option(
+    "--splits", "-s", multiple=True, default=[TRAIN_NAME, VAL_NAME, TEST_NAME]
+)
+@click.option("--samples_per_shard", default=10000)
+@click.option(
+    "--sequence_length",
+    default=None,
+    type=click.INT,
+    help="Longest window that should be exported. Defaults to the min_sequence_length "
+    "of the file list.",
+)
+def export(file_list, output_dir, splits, samples_per_shard, sequence_length):
+    file_list = FileList.load(file_list)
+    for split in splits:
+        export_tar_shards(
+            file_list,
+            split,
+            Path(output_dir),
+            samples_per_shard=samples_per_shard,
+            sequence_length=sequence_length,
+        )
+
+
+if __name__ == "__main__":
+    export()
@@ -17,6 +17,7 @@ from joblib import delayed
 from joblib import Parallel
 from tqdm import tqdm
 
+from faceforensics_internal.catalog import Catalog
 from faceforensics_internal.utils import Compression
 from faceforensics_internal.utils import DataType
 
@@ -69,14 +70,16 @@ def extract_method_videos(data_path, dataset, compression):
         DataType.full_images.__str__(),
     )
 
+    catalog = Catalog(data_path)
     Parallel(n_jobs=mp.cpu_count())(
         delayed(
             lambda _video: extract_frames(
                 join(videos_path, _video), join(images_path, _video.split(".")[0])
             )
-        )(video)
-        for video in tqdm(os.listdir(videos_path))
+        )(video.name)
+        for video in tqdm(catalog.videos(videos_path))
     )
+    catalog.save()
 
 
 if __name__ == "__main__":
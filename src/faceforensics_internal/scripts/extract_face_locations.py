@@ -10,6 +10,7 @@ from joblib import delayed
 from joblib import Parallel
 from tqdm import tqdm
 
+from faceforensics_internal.catalog import Catalog
 from faceforensics_internal.utils import Compression
 from faceforensics_internal.utils import DataType
 from faceforensics_internal.utils import FaceForensicsDataStructure
@@ -72,6 +73,8 @@ def extract_face_locations_from_videos(
     )
 
     # zip source and target structure to iterate over both simultaneously
+    catalog = Catalog(source_dir_root)
+    catalog.prefetch(source_dir_data_structure.get_subdirs())
     for source_sub_dir, target_sub_dir in zip(
         source_dir_data_structure.get_subdirs(), target_dir_data_structure.get_subdirs()
     ):
@@ -89,9 +92,11 @@ def extract_face_locations_from_videos(
                     _video_path, target_sub_dir
                 )
             )(video_path)
-            for video_path in tqdm(sorted(source_sub_dir.iterdir()))
+            for video_path in tqdm(catalog.videos(source_sub_dir))
         )
 
+    catalog.save()
+
 
 if __name__ == "__main__":
     extract_face_locations_from_videos()
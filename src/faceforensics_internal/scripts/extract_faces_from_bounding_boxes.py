@@ -2,6 +2,7 @@ import json
 import logging
 import multiprocessing as mp
 from pathlib import Path
+from typing import List
 
 import click
 import cv2
@@ -9,6 +10,8 @@ from joblib import delayed
 from joblib import Parallel
 from tqdm import tqdm
 
+from faceforensics_internal.catalog import Catalog
+from faceforensics_internal.file_list_dataset import FRAME_NAME
 from faceforensics_internal.utils import Compression
 from faceforensics_internal.utils import DataType
 from faceforensics_internal.utils import FaceForensicsDataStructure
@@ -27,7 +30,7 @@ def _extract_face(img_path, face, face_images_dir):
 
 
 def _extract_faces_from_video(
-    video_folder: Path, bounding_boxes: Path, face_images: Path
+    video_folder: Path, frames: List[int], bounding_boxes: Path, face_images: Path
 ) -> bool:
     with open(str((bounding_boxes / video_folder.name).with_suffix(".json")), "r") as f:
         faces = json.load(f)
@@ -36,7 +39,8 @@ def _extract_faces_from_video(
     face_images.mkdir(exist_ok=True)
 
     # extract all faces and save it
-    for img in sorted(video_folder.iterdir()):
+    for frame in frames:
+        img = video_folder / FRAME_NAME.format(frame)
         face = faces[img.with_suffix("").name]
         _extract_face(img, face, face_images)
 
@@ -72,6 +76,8 @@ def extract_faces(source_dir_root, compressions, methods, cpu_count):
         methods=methods,
     )
 
+    catalog = Catalog(source_dir_root)
+    catalog.prefetch(full_images_data_structure.get_subdirs())
     for full_images, bounding_boxes, face_images in zip(
         full_images_data_structure.get_subdirs(),
         bounding_boxes_dir_data_structure.get_subdirs(),
@@ -84,13 +90,15 @@ def extract_faces(source_dir_root, compressions, methods, cpu_count):
         # extract faces from videos in parallel
         Parallel(n_jobs=cpu_count)(
             delayed(
-                lambda _video_folder: _extract_faces_from_video(
-                    _video_folder, bounding_boxes, face_images
+                lambda _video_folder, _frames: _extract_faces_from_video(
+                    _video_folder, _frames, bounding_boxes, face_images
                 )
-            )(video_folder)
-            for video_folder in tqdm(sorted(full_images.iterdir()))
+            )(video_folder, catalog.frames(video_folder).tolist())
+            for video_folder in tqdm(catalog.videos(full_images))
         )
 
+    catalog.save()
+
 
 if __name__ == "__main__":
     extract_faces()
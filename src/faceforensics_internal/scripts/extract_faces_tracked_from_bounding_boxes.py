@@ -2,9 +2,6 @@ import json
 import logging
 import multiprocessing as mp
 from pathlib import Path
-from typing import Dict
-from typing import List
-from typing import Tuple
 
 import click
 import cv2
@@ -13,78 +10,15 @@ from joblib import delayed
 from joblib import Parallel
 from tqdm import tqdm
 
+from faceforensics_internal.catalog import Catalog
 from faceforensics_internal.utils import Compression
 from faceforensics_internal.utils import DataType
+from faceforensics_internal.utils import _face_bb_to_tracked_bb
 from faceforensics_internal.utils import FaceForensicsDataStructure
 
 logger = logging.getLogger(__file__)
 
 
-def _calculate_tracking_bounding_box(
-    face_bb: Dict[str, List[int]], image_size: Tuple[int, int], scale: int = 1.3
-):
-    height, width = image_size
-
-    bounding_boxes = face_bb.values()
-    left = min([bounding_box[0] for bounding_box in bounding_boxes])
-    top = min([bounding_box[1] for bounding_box in bounding_boxes])
-    right = max([bounding_box[0] + bounding_box[2] for bounding_box in bounding_boxes])
-    bottom = max([bounding_box[1] + bounding_box[3] for bounding_box in bounding_boxes])
-
-    x, y, w, h = left, top, right - left, bottom - top
-
-    size_bb = int(max(w, h) * scale)
-
-    center_x, center_y = x + int(0.5 * w), y + int(0.5 * h)
-
-    # Check for out of bounds, x-y lower left corner
-    x = max(int(center_x - size_bb // 2), 0)
-    y = max(int(center_y - size_bb // 2), 0)
-
-    # Check for too big size for given x, y
-    size_bb = min(width - x, size_bb)
-    size_bb = min(height - y, size_bb)
-
-    relative_bb = {}
-    for key in face_bb.keys():
-        _x, _y, w, h = face_bb[key]
-        relative_bb[key] = _x - x, _y - y, w, h
-        face_bb[key] = [x, y, size_bb, size_bb]
-
-    return relative_bb
-
-
-def _face_bb_to_tracked_bb(
-    face_bb: Dict[str, List[int]], image_size: Tuple[int, int], scale: int = 1.3
-):
-    current_sequence = {}
-    tracked_bb = {}
-    relative_bb = {}
-
-    def calculate_tracked_bb_for_sequence(image_name):
-        if len(current_sequence) > 0:
-            relative_bb.update(
-                _calculate_tracking_bounding_box(
-                    current_sequence, image_size, scale=scale
-                )
-            )
-            tracked_bb.update(current_sequence)
-        if image_name:
-            relative_bb[image_name] = None
-            tracked_bb[image_name] = None
-
-    for image_name, face_bb_value in sorted(face_bb.items()):
-        if not face_bb_value:
-            calculate_tracked_bb_for_sequence(image_name)
-            current_sequence = {}
-        else:
-            current_sequence[image_name] = face_bb_value
-
-    if len(current_sequence) > 0:
-        calculate_tracked_bb_for_sequence(None)
-    return tracked_bb, relative_bb
-
-
 def _extract_face(img, face, face_images_dir, frame_number):
     if not face:
         return False
@@ -98,13 +32,8 @@ def _extract_face(img, face, face_images_dir, frame_number):
     return True
 
 
-def _get_image_size(video_folder: Path):
-    height, width, _ = cv2.imread(str(next(video_folder.iterdir()))).shape
-    return height, width
-
-
 def _extract_faces_tracked_from_video(
-    video_folder: Path, bounding_boxes: Path, face_images: Path
+    video_folder: Path, bounding_boxes: Path, face_images: Path, scale: float = 1
 ) -> bool:
     with open(str((bounding_boxes / video_folder.name).with_suffix(".json")), "r") as f:
         face_bb = json.load(f)
@@ -116,7 +45,7 @@ def _extract_faces_tracked_from_video(
     width = cap.get(cv2.CAP_PROP_FRAME_WIDTH)
     height = cap.get(cv2.CAP_PROP_FRAME_HEIGHT)
     tracked_bb, relative_bb = _face_bb_to_tracked_bb(
-        face_bb, image_size=(height, width), scale=1
+        face_bb, image_size=(height, width), scale=scale
     )
 
     # extract all faces and save it
@@ -139,6 +68,10 @@ def _extract_faces_tracked_from_video(
     with open(face_images / "tracked_bb.json", "w") as f:
         json.dump(tracked_bb, f)
 
+    # smaller scales are cropped from these crops by the FileListDataset (face_scale)
+    with open(face_images / "crop_scale.json", "w") as f:
+        json.dump({"scale": scale}, f)
+
     return True
 
 
@@ -148,7 +81,13 @@ def _extract_faces_tracked_from_video(
 @click.option(
     "--methods", "-m", multiple=True, default=FaceForensicsDataStructure.ALL_METHODS
 )
-def extract_faces_tracked(source_dir_root, compressions, methods):
+@click.option(
+    "--scale",
+    default=1.0,
+    help="Size of the crops relative to the face. Use the largest scale needed, "
+    "smaller ones can be selected with face_scale in the FileListDataset.",
+)
+def extract_faces_tracked(source_dir_root, compressions, methods, scale):
     videos_data_structure = FaceForensicsDataStructure(
         source_dir_root,
         compressions=compressions,
@@ -170,6 +109,8 @@ def extract_faces_tracked(source_dir_root, compressions, methods):
         methods=methods,
     )
 
+    catalog = Catalog(source_dir_root)
+    catalog.prefetch(videos_data_structure.get_subdirs())
     for videos, bounding_boxes, face_images in zip(
         videos_data_structure.get_subdirs(),
         bounding_boxes_dir_data_structure.get_subdirs(),
@@ -183,12 +124,14 @@ def extract_faces_tracked(source_dir_root, compressions, methods):
         Parallel(n_jobs=mp.cpu_count())(
             delayed(
                 lambda _video_folder: _extract_faces_tracked_from_video(
-                    _video_folder, bounding_boxes, face_images
+                    _video_folder, bounding_boxes, face_images, scale
                 )
             )(video_folder)
-            for video_folder in tqdm(sorted(videos.iterdir()))
+            for video_folder in tqdm(catalog.videos(videos))
         )
 
+    catalog.save()
+
 
 if __name__ == "__main__":
     extract_faces_tracked()
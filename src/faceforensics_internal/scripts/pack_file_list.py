@@ -0,0 +1,44 @@
+import logging
+import multiprocessing as mp
+from pathlib import Path
+
+import click
+
+from faceforensics_internal.file_list_dataset import FileList
+from faceforensics_internal.packed_file_list_dataset import pack_file_list
+from faceforensics_internal.splits import TEST_NAME
+from faceforensics_internal.splits import TRAIN_NAME
+from faceforensics_internal.splits import VAL_NAME
+
+logger = logging.getLogger(__file__)
+
+
+@click.command()
+@click.option("--file_list", required=True, type=click.Path(exists=True))
+@click.option("--output_dir", required=True, type=click.Path())
+@click.option(
+    "--splits", "-s", multiple=True, default=[TRAIN_NAME, VAL_NAME, TEST_NAME]
+)
+@click.option(
+    "--sequence_length",
+    default=None,
+    type=click.INT,
+    help="Longest window that should be packed. Defaults to the min_sequence_length "
+    "of the file list.",
+)
+@click.option("--shard_size_mb", default=1024)
+@click.option("--num_threads", required=False, type=click.INT, default=mp.cpu_count())
+def pack(file_list, output_dir, splits, sequence_length, shard_size_mb, num_threads):
+    file_list = FileList.load(file_list)
+    pack_file_list(
+        file_list,
+        Path(output_dir),
+        splits=splits,
+        sequence_length=sequence_length,
+        shard_size=shard_size_mb * 2 ** 20,
+        num_threads=num_threads,
+    )
+
+
+if __name__ == "__main__":
+    pack()
@@ -6,6 +6,7 @@ import subprocess
 import click
 from tqdm import tqdm
 
+from faceforensics_internal.catalog import Catalog
 from faceforensics_internal.utils import Compression
 from faceforensics_internal.utils import DataType
 from faceforensics_internal.utils import FaceForensicsDataStructure
@@ -50,6 +51,8 @@ def resample_videos(source_dir_root, compressions, methods, fps):
         data_types=(DataType.resampled_videos,),
     )
 
+    catalog = Catalog(source_dir_root)
+    catalog.prefetch(videos_data_structure.get_subdirs())
     for videos, resampled_videos in zip(
         videos_data_structure.get_subdirs(),
         resampled_videos_data_structure.get_subdirs(),
@@ -65,11 +68,13 @@ def resample_videos(source_dir_root, compressions, methods, fps):
             tqdm(
                 [
                     (_video_folder, resampled_videos, fps)
-                    for _video_folder in sorted(videos.iterdir())
+                    for _video_folder in catalog.videos(videos)
                 ]
             ),
         )
 
+    catalog.save()
+
 
 if __name__ == "__main__":
     resample_videos()
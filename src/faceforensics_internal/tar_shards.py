@@ -0,0 +1,242 @@
+"""Sequential tar shards of a FileList split and a dataset that streams them.
+
+Each split is written to output_dir/<split>/ as shard-000000.tar, shard-000001.tar, ...
+and an index.json. A shard holds whole videos, i.e. all frames that can be reached by a
+window ending in a sampled frame. Every frame is stored as <key>.png (the original png
+file) followed by <key>.json with its video, frame number, label and whether it is one
+of the sampled frames (samples_idx). A new shard is started at the next video once a
+shard holds samples_per_shard sampled frames.
+"""
+import io
+import json
+import logging
+import tarfile
+import time
+from collections import deque
+from pathlib import Path
+from typing import List
+
+import numpy as np
+import torch
+from PIL import Image
+from torch.utils.data import get_worker_info
+from torch.utils.data import IterableDataset
+from tqdm import tqdm
+
+from faceforensics_internal.file_list_dataset import _referenced_frames
+from faceforensics_internal.file_list_dataset import _split_sample_path
+from faceforensics_internal.file_list_dataset import FileList
+
+logger = logging.getLogger(__file__)
+
+SHARD_NAME = "shard-{:06d}.tar"
+SHARD_INDEX = "index.json"
+
+
+def _add_to_tar(tar: tarfile.TarFile, name: str, data: bytes):
+    tar_info = tarfile.TarInfo(name)
+    tar_info.size = len(data)
+    tar_info.mtime = time.time()
+    tar.addfile(tar_info, io.BytesIO(data))
+
+
+def export_tar_shards(
+    file_list: FileList,
+    split: str,
+    output_dir: Path,
+    samples_per_shard: int = 10000,
+    sequence_length: int = None,
+):
+    """Writes split of file_list into tar shards in output_dir/split.
+
+    Args:
+        file_list: file list that should be exported
+        split: split that should be exported
+        output_dir: shards are written to output_dir/split
+        samples_per_shard: number of sampled frames after which a new shard is started
+        sequence_length: longest window the shards can be read with. Defaults to
+            file_list.min_sequence_length.
+
+    """
+    output_dir = Path(output_dir) / split
+    output_dir.mkdir(parents=True, exist_ok=True)
+    sequence_length = sequence_length or file_list.min_sequence_length
+
+    samples = file_list.samples[split]
+    sampled = set(np.asarray(file_list.samples_idx[split]).tolist())
+    frames = _referenced_frames(file_list.samples_idx[split], sequence_length)
+
+    shards = []
+    tar = None
+    last_video = None
+    for key, sample_index in enumerate(tqdm(frames)):
+        sample_path, label = samples[sample_index]
+        video, frame = _split_sample_path(sample_path)
+
+        if video != last_video and (
+            tar is None or shards[-1]["samples"] >= samples_per_shard
+        ):
+            if tar is not None:
+                tar.close()
+            shards.append({"name": SHARD_NAME.format(len(shards)), "samples": 0})
+            tar = tarfile.open(output_dir / shards[-1]["name"], "w")
+        last_video = video
+
+        is_sampled = int(sample_index) in sampled
+        shards[-1]["samples"] += is_sampled
+        with open(f"{file_list.root}/{sample_path}", "rb") as f:
+            _add_to_tar(tar, f"{key:09d}.png", f.read())
+        meta = {"video": video, "frame": frame, "label": label, "sampled": is_sampled}
+        _add_to_tar(tar, f"{key:09d}.json", json.dumps(meta).encode())
+
+    if tar is not None:
+        tar.close()
+
+    with open(output_dir / SHARD_INDEX, "w") as f:
+        json.dump(
+            {
+                "classes": file_list.classes,
+                "class_to_idx": file_list.class_to_idx,
+                "sequence_length": sequence_length,
+                "shards": shards,
+            },
+            f,
+        )
+    logger.info(f"Exported {split} to {len(shards)} shards in {output_dir}.")
+
+
+class TarShardDataset(IterableDataset):
+    """Streams the samples of tar shards written by export_tar_shards.
+
+    The shards are read sequentially. Each epoch the order of the shards is shuffled
+    (the same way in every worker) and the shards are split between the DataLoader
+    workers. The samples are additionally shuffled with a buffer of shuffle_buffer
+    samples. Returns the same (sample, target) tuples as FileListDataset.
+
+    Like with DistributedSampler, set_epoch has to be called at the beginning of each
+    epoch, before iterating over the DataLoader. Otherwise every epoch uses the same
+    order. The DataLoader workers iterate over copies of the dataset, so the epoch
+    can't be advanced by the dataset itself:
+
+        for epoch in range(epochs):
+            dataset.set_epoch(epoch)
+            for samples, targets in loader:
+                ...
+
+    Args:
+        shard_dir: directory of the shards of one split (output_dir/split)
+        sequence_length: number of consecutive frames returned per sample
+        transform: applied to every frame, see FileListDataset
+        target_transform: applied to the target
+        shuffle: shuffle the shards and the samples
+        shuffle_buffer: number of samples the shuffle buffer holds
+        seed: seed of the random number generator. Every epoch uses seed and the
+            epoch given to set_epoch.
+
+    """
+
+    def __init__(
+        self,
+        shard_dir: Path,
+        sequence_length: int = 1,
+        transform=None,
+        target_transform=None,
+        shuffle: bool = True,
+        shuffle_buffer: int = 1000,
+        seed: int = 0,
+    ):
+        self.shard_dir = Path(shard_dir)
+        with open(self.shard_dir / SHARD_INDEX, "r") as f:
+            index = json.load(f)
+        if sequence_length > index["sequence_length"]:
+            logger.warning(
+                f"{sequence_length}>{index['sequence_length']}. Windows that are not "
+                f"in the shards are skipped."
+            )
+        self.classes = index["classes"]
+        self.class_to_idx = index["class_to_idx"]
+        self.shards = index["shards"]
+
+        self.sequence_length = sequence_length
+        self.transform = transform
+        self.target_transform = target_transform
+        self.shuffle = shuffle
+        self.shuffle_buffer = shuffle_buffer
+        self.seed = seed
+        self.epoch = 0
+
+    def set_epoch(self, epoch: int):
+        """Sets the epoch that determines the order of the next iteration."""
+        self.epoch = epoch
+
+    def _worker_shards(self, rng: np.random.RandomState) -> List[str]:
+        shards = [shard["name"] for shard in self.shards]
+        if self.shuffle:
+            rng.shuffle(shards)
+        worker_info = get_worker_info()
+        if worker_info is not None:
+            shards = shards[worker_info.id :: worker_info.num_workers]  # noqa E203
+        return shards
+
+    def _read_shard(self, shard: str):
+        """Yields the frames of a window ending in a sampled frame and its label."""
+        window = deque(maxlen=self.sequence_length)
+        last_video, last_frame = None, None
+        image = None
+        with tarfile.open(self.shard_dir / shard, "r|") as tar:
+            for member in tar:
+                data = tar.extractfile(member).read()
+                if member.name.endswith(".png"):
+                    image = data
+                    continue
+
+                meta = json.loads(data.decode())
+                if meta["video"] != last_video or meta["frame"] != last_frame + 1:
+                    window.clear()
+                last_video, last_frame = meta["video"], meta["frame"]
+                window.append(image)
+                if meta["sampled"] and len(window) == self.sequence_length:
+                    yield list(window), meta["label"]
+
+    def _to_sample(self, images: List[bytes], target: int):
+        samples = [Image.open(io.BytesIO(image)).convert("RGB") for image in images]
+        if self.transform is not None:
+            samples = list(map(self.transform, samples))
+
+        if self.sequence_length == 1:
+            samples = samples[0]
+        else:
+            samples = torch.stack(samples, dim=0)
+
+        if self.target_transform is not None:
+            target = self.target_transform(target)
+
+        return samples, target
+
+    def __iter__(self):
+        rng = np.random.RandomState([self.seed, self.epoch])
+        shards = self._worker_shards(rng)
+        # the shard order has to be the same in all workers, the sample order not
+        worker_info = get_worker_info()
+        if worker_info is not None:
+            rng = np.random.RandomState([self.seed, self.epoch, worker_info.id])
+
+        buffer = []
+        for shard in shards:
+            for window in self._read_shard(shard):
+                if not self.shuffle:
+                    yield self._to_sample(*window)
+                    continue
+                if len(buffer) < self.shuffle_buffer:
+                    buffer.append(window)
+                    continue
+                idx = rng.randint(len(buffer))
+                buffer[idx], window = window, buffer[idx]
+                yield self._to_sample(*window)
+
+        rng.shuffle(buffer)
+        for window in buffer:
+            yield self._to_sample(*window)
+
+    def __len__(self):
+        return sum(shard["samples"] for shard in self.shards)
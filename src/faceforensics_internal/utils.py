@@ -2,8 +2,10 @@ import itertools
 from enum import auto
 from enum import Enum
 from pathlib import Path
+from typing import Dict
 from typing import Iterable
 from typing import List
+from typing import Optional
 from typing import Tuple
 from typing import Union
 
@@ -41,6 +43,7 @@ class DataType(StrEnum):
     face_information = auto()
     videos = auto()
     resampled_videos = auto()
+    rle_masks = auto()
 
 
 class Method:
@@ -132,6 +135,110 @@ def _img_name_to_int(img: Path):
     return int(img.name.split(".")[0])
 
 
+def _calculate_tracking_bounding_box(
+    face_bb: Dict[str, List[int]], image_size: Tuple[int, int], scale: int = 1.3
+):
+    height, width = image_size
+
+    bounding_boxes = face_bb.values()
+    left = min([bounding_box[0] for bounding_box in bounding_boxes])
+    top = min([bounding_box[1] for bounding_box in bounding_boxes])
+    right = max([bounding_box[0] + bounding_box[2] for bounding_box in bounding_boxes])
+    bottom = max([bounding_box[1] + bounding_box[3] for bounding_box in bounding_boxes])
+
+    x, y, w, h = left, top, right - left, bottom - top
+
+    size_bb = int(max(w, h) * scale)
+
+    center_x, center_y = x + int(0.5 * w), y + int(0.5 * h)
+
+    # Check for out of bounds, x-y lower left corner
+    x = max(int(center_x - size_bb // 2), 0)
+    y = max(int(center_y - size_bb // 2), 0)
+
+    # Check for too big size for given x, y
+    size_bb = min(width - x, size_bb)
+    size_bb = min(height - y, size_bb)
+
+    relative_bb = {}
+    for key in face_bb.keys():
+        _x, _y, w, h = face_bb[key]
+        relative_bb[key] = _x - x, _y - y, w, h
+        face_bb[key] = [x, y, size_bb, size_bb]
+
+    return relative_bb
+
+
+def _face_bb_to_tracked_bb(
+    face_bb: Dict[str, List[int]], image_size: Tuple[int, int], scale: int = 1.3
+):
+    current_sequence = {}
+    tracked_bb = {}
+    relative_bb = {}
+
+    def calculate_tracked_bb_for_sequence(image_name):
+        if len(current_sequence) > 0:
+            relative_bb.update(
+                _calculate_tracking_bounding_box(
+                    current_sequence, image_size, scale=scale
+                )
+            )
+            tracked_bb.update(current_sequence)
+        if image_name:
+            relative_bb[image_name] = None
+            tracked_bb[image_name] = None
+
+    for image_name, face_bb_value in sorted(face_bb.items()):
+        if not face_bb_value:
+            calculate_tracked_bb_for_sequence(image_name)
+            current_sequence = {}
+        else:
+            current_sequence[image_name] = face_bb_value
+
+    if len(current_sequence) > 0:
+        calculate_tracked_bb_for_sequence(None)
+    return tracked_bb, relative_bb
+
+
+def _sub_crop_bbs(
+    tracked_bb: Dict[str, Optional[List[int]]],
+    relative_bb: Dict[str, Optional[List[int]]],
+    scale: float,
+) -> Dict[str, Optional[List[int]]]:
+    """Returns the bounding boxes of crops with scale inside of crops stored with a
+    larger scale.
+
+    The crops of each sequence of frames with faces are computed like
+    _face_bb_to_tracked_bb does, but from the face positions relative to the stored
+    crop (relative_bb) and bounded by the stored crop (tracked_bb) instead of the
+    frame. So the result is the same as extracting with scale, unless the larger crop
+    was cut off at the border of the frame. The boxes are ints, even if the stored
+    crops have float sizes because they were clamped at the border of the frame.
+    """
+    sub_crop_bb = {}
+    current_sequence = {}
+    for image_name in sorted(relative_bb) + [None]:
+        face_bb = relative_bb.get(image_name)
+        if face_bb:
+            current_sequence[image_name] = list(face_bb)
+            continue
+        if current_sequence:
+            _, _, w, h = tracked_bb[next(iter(current_sequence))]
+            _calculate_tracking_bounding_box(
+                current_sequence, image_size=(h, w), scale=scale
+            )
+            sub_crop_bb.update(
+                {
+                    name: [int(value) for value in bounding_box]
+                    for name, bounding_box in current_sequence.items()
+                }
+            )
+            current_sequence = {}
+        if image_name:
+            sub_crop_bb[image_name] = None
+    return sub_crop_bb
+
+
 def get_mask_bounding_boxes(mask: np.ndarray) -> List[List[int]]:
     a = np.where(mask != 0)
     try:
@@ -0,0 +1,115 @@
+"""Dataset that iterates over whole videos for evaluation."""
+import logging
+from typing import List
+
+import numpy as np
+import torch
+from torch.utils.data import get_worker_info
+from torch.utils.data import IterableDataset
+
+from faceforensics_internal.file_list_dataset import _referenced_frames
+from faceforensics_internal.file_list_dataset import FileListDataset
+
+logger = logging.getLogger(__file__)
+
+
+class VideoEvaluationDataset(IterableDataset):
+    """Iterates over the samples of a FileListDataset video by video.
+
+    Every frame of a video is loaded (and transformed) exactly once into one clip
+    tensor, even if it is part of many windows. The windows of sequence_length frames
+    ending in the samples of the video are strided views into this clip, so
+    overlapping windows share their memory.
+
+    Yields (samples, targets, video_id, is_last) tuples. samples holds the windows of
+    at most max_windows consecutive samples of one video with shape (N, C, H, W) for
+    sequence_length 1 and (N, sequence_length, C, H, W) otherwise, targets their
+    labels. video_id is the id of the video (see FileListDataset.get_video_ids and
+    video_name) and is_last marks the last tuple of a video, so video-level scores can
+    be aggregated while iterating. Use it with batch_size=None in the DataLoader. With
+    several workers the videos are split between them.
+
+    The transform of the dataset has to return tensors of the same shape for every
+    frame and should be deterministic, as it's applied once per frame and not per
+    window.
+
+    Args:
+        dataset: dataset whose samples are iterated, usually of the test split
+        max_windows: maximal number of windows per yielded tuple. Defaults to all
+            windows of a video.
+
+    """
+
+    def __init__(self, dataset: FileListDataset, max_windows: int = None):
+        self.dataset = dataset
+        self.max_windows = max_windows
+        self.sequence_length = dataset.sequence_length
+
+        samples_idx = np.asarray(dataset.samples_idx, dtype=np.int64)
+        video_ids = dataset.get_video_ids()
+        order = np.argsort(video_ids, kind="stable")
+        self.video_ids, starts = np.unique(video_ids[order], return_index=True)
+        self._video_samples = np.split(samples_idx[order], starts[1:])
+
+    def video_name(self, video_id: int) -> str:
+        """Returns the directory of the frames of video_id."""
+        return self.dataset._samples.directories[video_id]
+
+    def _load_clip(self, frames: np.ndarray) -> torch.Tensor:
+        """Loads and transforms each of the frames once and stacks them."""
+
+        def _load(sample_index):
+            image = self.dataset._load_frame(int(sample_index))
+            if self.dataset.transform is not None:
+                image = self.dataset.transform(image)
+            return image
+
+        return torch.stack(list(self.dataset._get_executor().map(_load, frames)))
+
+    def _windows(self, clip: torch.Tensor, positions: np.ndarray) -> torch.Tensor:
+        """Returns a view of the windows ending at the consecutive positions of clip."""
+        if self.sequence_length > 1:
+            # (N - L + 1, C, H, W, L) -> (N - L + 1, L, C, H, W), both views of clip
+            clip = clip.unfold(0, self.sequence_length, 1)
+            clip = clip.permute(0, clip.dim() - 1, *range(1, clip.dim() - 1))
+            positions = positions - self.sequence_length + 1
+        return clip[positions[0] : positions[-1] + 1]  # noqa E203
+
+    def _targets(self, samples_idx: np.ndarray) -> List[int]:
+        targets = self.dataset.targets[samples_idx].tolist()
+        if self.dataset.target_transform is not None:
+            targets = list(map(self.dataset.target_transform, targets))
+        return targets
+
+    def _iter_video(self, video_id: int, samples_idx: np.ndarray):
+        frames = _referenced_frames(samples_idx, self.sequence_length)
+        clip = self._load_clip(frames)
+        # all frames of a window are referenced, so it's contiguous in frames as well
+        positions = np.searchsorted(frames, samples_idx)
+
+        # split the windows into chunks of consecutive positions, each one is a view
+        breaks = np.flatnonzero(np.diff(positions) != 1) + 1
+        starts = [0]
+        for stop in breaks.tolist() + [len(samples_idx)]:
+            if self.max_windows is not None:
+                step = self.max_windows
+                starts.extend(range(starts[-1] + step, stop, step))
+            starts.append(stop)
+
+        for start, stop in zip(starts[:-1], starts[1:]):
+            yield (
+                self._windows(clip, positions[start:stop]),
+                torch.as_tensor(self._targets(samples_idx[start:stop])),
+                int(video_id),
+                stop == len(samples_idx),
+            )
+
+    def __iter__(self):
+        videos = range(len(self.video_ids))
+        worker_info = get_worker_info()
+        if worker_info is not None:
+            videos = videos[worker_info.id :: worker_info.num_workers]  # noqa E203
+        for video in videos:
+            yield from self._iter_video(
+                self.video_ids[video], self._video_samples[video]
+            )
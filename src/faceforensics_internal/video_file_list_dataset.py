@@ -0,0 +1,270 @@
+"""Dataset that crops the faces of a FileList on the fly from the videos.
+
+The FileList doesn't need the extracted face images either, VideoCatalog lists the
+frames extract_faces_tracked_from_bounding_boxes would extract from the videos and
+their bounding boxes:
+
+    create_file_list --source_dir_root <root> --output_dir <dir> --from_videos
+    file_list.get_dataset("train", dataset_cls=VideoFileListDataset)
+"""
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict
+from typing import List
+from typing import Tuple
+from typing import Union
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from faceforensics_internal.catalog import Catalog
+from faceforensics_internal.catalog import DEFAULT_SCAN_WORKERS
+from faceforensics_internal.file_list_dataset import _split_sample_path
+from faceforensics_internal.file_list_dataset import FileList
+from faceforensics_internal.file_list_dataset import FileListDataset
+from faceforensics_internal.utils import _face_bb_to_tracked_bb
+from faceforensics_internal.utils import DataType
+
+logger = logging.getLogger(__file__)
+
+VIDEO_SUFFIX = ".mp4"
+TRACKED_BB = "tracked_bb.json"
+# forward jumps of at most this many frames are decoded instead of seeking
+MAX_GRAB_FRAMES = 16
+
+
+def _video_path(root: Path, directory: str, video_data_type: str) -> Path:
+    """Returns the video of <method>/<compression>/<data_type>/<video>."""
+    directory = Path(root) / directory
+    video_path = directory.parents[1] / video_data_type / directory.name
+    return video_path.with_suffix(VIDEO_SUFFIX)
+
+
+def _video_size(video_path: Path) -> Tuple[float, float, int]:
+    """Returns height, width and number of frames of video_path."""
+    capture = cv2.VideoCapture(str(video_path))
+    height = capture.get(cv2.CAP_PROP_FRAME_HEIGHT)
+    width = capture.get(cv2.CAP_PROP_FRAME_WIDTH)
+    nb_frames = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+    capture.release()
+    return height, width, nb_frames
+
+
+def _load_tracked_bb(
+    root: Path, directory: str, video_data_type: str, bounding_boxes_data_type: str
+) -> Dict[str, List[int]]:
+    """Returns the tracked bounding boxes of directory, from its tracked_bb.json if it
+    exists or computed from the bounding boxes like
+    extract_faces_tracked_from_bounding_boxes does."""
+    directory_path = Path(root) / directory
+    tracked_bb_path = directory_path / TRACKED_BB
+    if tracked_bb_path.exists():
+        with open(tracked_bb_path, "r") as f:
+            return json.load(f)
+
+    bounding_boxes_path = (
+        directory_path.parents[1] / bounding_boxes_data_type / directory_path.name
+    ).with_suffix(".json")
+    with open(bounding_boxes_path, "r") as f:
+        face_bb = json.load(f)
+    height, width, _ = _video_size(_video_path(root, directory, video_data_type))
+    tracked_bb, _ = _face_bb_to_tracked_bb(face_bb, image_size=(height, width), scale=1)
+    return tracked_bb
+
+
+class VideoCatalog:
+    """Lists the frames that extract_faces_tracked_from_bounding_boxes would extract,
+    without the extracted images.
+
+    It can be used instead of a Catalog by create_file_list. The video folders are
+    <method>/<compression>/<data_type>/<video> like the folders of the extracted
+    images, one for every <method>/<compression>/<video_data_type>/<video>.mp4. Their
+    frames are the frames of the video that have a tracked bounding box (see
+    VideoFileListDataset).
+
+    Args:
+        root: root of the dataset
+        index_file: see Catalog, used for listing the videos
+        max_workers: see Catalog
+        video_data_type: data type of the videos
+        bounding_boxes_data_type: data type of the bounding boxes of the faces
+
+    """
+
+    def __init__(
+        self,
+        root: Union[str, Path],
+        index_file: Union[str, Path] = None,
+        max_workers: int = DEFAULT_SCAN_WORKERS,
+        video_data_type: Union[str, DataType] = DataType.videos,
+        bounding_boxes_data_type: Union[str, DataType] = DataType.face_information,
+    ):
+        self.root = Path(root)
+        self.video_data_type = str(video_data_type)
+        self.bounding_boxes_data_type = str(bounding_boxes_data_type)
+        self.max_workers = max_workers
+        self._catalog = Catalog(root, index_file, max_workers)
+        self._frames = {}
+
+    def _video_dir(self, subdir: Union[str, Path]) -> Path:
+        return Path(subdir).parent / self.video_data_type
+
+    def prefetch(self, subdirs):
+        """Lists the videos of subdirs and reads their bounding boxes concurrently."""
+        subdirs = list(subdirs)
+        self._catalog.prefetch([self._video_dir(subdir) for subdir in subdirs])
+        videos = [video for subdir in subdirs for video in self.videos(subdir)]
+        with ThreadPoolExecutor(max_workers=max(self.max_workers, 1)) as executor:
+            list(executor.map(self.frames, videos))
+
+    def save(self):
+        self._catalog.save()
+
+    def videos(self, subdir: Union[str, Path]) -> List[Path]:
+        return [
+            Path(subdir) / video.stem
+            for video in self._catalog.videos(self._video_dir(subdir))
+            if video.suffix == VIDEO_SUFFIX
+        ]
+
+    def frames(self, video: Union[str, Path]) -> np.ndarray:
+        directory = Path(video).relative_to(self.root).as_posix()
+        if directory not in self._frames:
+            self._frames[directory] = self._read_frames(directory)
+        return self._frames[directory]
+
+    def _read_frames(self, directory: str) -> np.ndarray:
+        tracked_bb = _load_tracked_bb(
+            self.root, directory, self.video_data_type, self.bounding_boxes_data_type
+        )
+        _, _, nb_frames = _video_size(
+            _video_path(self.root, directory, self.video_data_type)
+        )
+        return np.array(
+            sorted(
+                int(frame)
+                for frame, face in tracked_bb.items()
+                if face and int(frame) < nb_frames
+            ),
+            dtype=np.int64,
+        )
+
+
+class VideoFileListDataset(FileListDataset):
+    """FileListDataset that reads the frames from the (compressed) videos and crops the
+    faces in memory instead of loading the extracted face images.
+
+    The samples of the file list are still used, i.e. the dataset returns the same
+    samples as the one on the extracted images. For a sample
+    <method>/<compression>/<data_type>/<video>/<frame>.png the frame is read from
+    <method>/<compression>/<video_data_type>/<video>.mp4. The face is cropped with
+    <method>/<compression>/<data_type>/<video>/tracked_bb.json if it exists. Otherwise
+    the tracked bounding boxes are computed from
+    <method>/<compression>/<bounding_boxes_data_type>/<video>.json the same way
+    extract_faces_tracked_from_bounding_boxes does.
+
+    Each worker keeps its last VideoCapture open. Frames up to MAX_GRAB_FRAMES after
+    the last read frame are decoded by reading forward, for all other frames the
+    capture seeks. So sequential access (e.g. windows of sequence_length > 1) only
+    decodes every frame once and random access doesn't decode the video from its start.
+    """
+
+    def __init__(
+        self,
+        file_list: FileList,
+        split: str,
+        sequence_length: int,
+        transform=None,
+        target_transform=None,
+        video_data_type: Union[str, DataType] = DataType.videos,
+        bounding_boxes_data_type: Union[str, DataType] = DataType.face_information,
+        **kwargs,
+    ):
+        super().__init__(
+            file_list,
+            split,
+            sequence_length,
+            transform=transform,
+            target_transform=target_transform,
+            **kwargs,
+        )
+        self.video_data_type = str(video_data_type)
+        self.bounding_boxes_data_type = str(bounding_boxes_data_type)
+
+        self._video_tracked_bbs = {}
+        self._capture = None
+        self._capture_path = None
+        self._next_frame = 0
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        # the open video and the lock are created again in each worker
+        state = super().__getstate__()
+        state["_capture"] = None
+        state["_capture_path"] = None
+        state["_lock"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def _video_path(self, directory: str) -> Path:
+        return _video_path(self.root, directory, self.video_data_type)
+
+    def _get_tracked_bb(self, directory: str) -> Dict[str, List[int]]:
+        if directory not in self._video_tracked_bbs:
+            self._video_tracked_bbs[directory] = _load_tracked_bb(
+                self.root,
+                directory,
+                self.video_data_type,
+                self.bounding_boxes_data_type,
+            )
+        return self._video_tracked_bbs[directory]
+
+    def _read_video_frame(self, video_path: Path, frame: int) -> np.ndarray:
+        """Reads frame of video_path with the open VideoCapture if possible."""
+        if self._capture is None or self._capture_path != video_path:
+            if self._capture is not None:
+                self._capture.release()
+            self._capture = cv2.VideoCapture(str(video_path))
+            self._capture_path = video_path
+            self._next_frame = 0
+
+        if not 0 <= frame - self._next_frame <= MAX_GRAB_FRAMES:
+            if self._capture.set(cv2.CAP_PROP_POS_FRAMES, frame):
+                self._next_frame = frame
+            else:
+                # not seekable, decode from the start
+                self._capture.release()
+                self._capture = cv2.VideoCapture(str(video_path))
+                self._next_frame = 0
+
+        while self._next_frame < frame:
+            self._capture.grab()
+            self._next_frame += 1
+
+        success, image = self._capture.read()
+        self._next_frame += 1
+        if not success:
+            self._capture.release()
+            self._capture = None
+            raise IOError(f"Could not read frame {frame} of {video_path}.")
+        return image
+
+    def _read(self, sample_path: str):
+        directory, frame = _split_sample_path(sample_path)
+        face = self._get_tracked_bb(directory)[f"{frame:04d}"]
+        if not face:
+            raise ValueError(f"There is no face in {sample_path}.")
+
+        with self._lock:
+            image = self._read_video_frame(self._video_path(directory), frame)
+
+        x, y, w, h = face
+        cropped_face = image[y : y + int(h), x : x + int(w)]  # noqa E203
+        return Image.fromarray(cv2.cvtColor(cropped_face, cv2.COLOR_BGR2RGB))